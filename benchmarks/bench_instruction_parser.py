@@ -0,0 +1,79 @@
+"""
+Benchmark of InstructionParser on large generated LLM responses.
+
+    python benchmarks/bench_instruction_parser.py --size-mb 5 --chunk-size 64
+
+Compares the previous whole-text regex with the state machine, parsing the response at once
+and fed in streaming-sized chunks.
+"""
+import os
+import re
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+LEGACY_BLOCK_PATTERN = r'###(\w+):\s*(\S+)\s*```(?:.*?)\n(.*?)```'
+
+
+def generate_response(size_bytes: int) -> str:
+    parts = ["Here are the changes.\n###COMMIT: benchmark-changes\n"]
+    size, index = 0, 0
+    while size < size_bytes:
+        if index % 3 == 2:
+            block = (f"###NEW: docs/page_{index}.md\n````markdown\n# Page {index}\n\n```python\nprint({index})\n```\n\n"
+                     + "Some documentation text.\n" * 40 + "````\n")
+        else:
+            lines = "".join(f" line {n}\n-old value {n}\n+new value {n}\n" for n in range(40))
+            block = f"###PATCH: src/module_{index}.py\n```python\n@@ -1,80 +1,80 @@\n{lines}```\n"
+        parts.append(block)
+        size += len(block)
+        index += 1
+    parts.append("Run the tests afterwards.\n")
+    return "".join(parts)
+
+
+def timed(function, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def parse_streaming(text: str, chunk_size: int):
+    from my_engineer.shared_models.llm_response.instruction_parser import InstructionParser
+    parser = InstructionParser()
+    for start in range(0, len(text), chunk_size):
+        parser.feed(text[start:start + chunk_size])
+    parser.close()
+    return parser.instructions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="InstructionParser benchmark")
+    parser.add_argument("--size-mb", type=float, default=5, help="Size of the generated response (default: 5)")
+    parser.add_argument("--chunk-size", type=int, default=64, help="Characters per streamed chunk (default: 64)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, the best is reported (default: 3)")
+    args = parser.parse_args()
+    # Importing my_engineer parses the command line of the main CLI
+    sys.argv = sys.argv[:1]
+    from my_engineer.shared_models.llm_response.instruction_parser import InstructionParser
+
+    text = generate_response(int(args.size_mb * 1024 * 1024))
+    megabytes = len(text) / 1024 / 1024
+    print(f"Response: {megabytes:.1f} MB, {text.count(chr(10)):,} lines")
+
+    legacy_time, legacy = timed(lambda: list(re.finditer(LEGACY_BLOCK_PATTERN, text, re.DOTALL)), args.repeat)
+    whole_time, (instructions, _, _, _) = timed(lambda: InstructionParser.extract_instructions(text), args.repeat)
+    stream_time, streamed = timed(lambda: parse_streaming(text, args.chunk_size), args.repeat)
+
+    print(f"{'Legacy regex':<28}{legacy_time:8.3f}s {megabytes / legacy_time:8.1f} MB/s  {len(legacy):,} blocks (nested fences split)")
+    print(f"{'State machine, whole text':<28}{whole_time:8.3f}s {megabytes / whole_time:8.1f} MB/s  {len(instructions):,} instructions")
+    print(f"{f'State machine, {args.chunk_size}-char chunks':<28}{stream_time:8.3f}s {megabytes / stream_time:8.1f} MB/s  {len(streamed):,} instructions")
+
+
+if __name__ == "__main__":
+    main()
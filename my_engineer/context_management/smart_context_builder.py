@@ -14,7 +14,8 @@ from ..shared_utils.user_input import get_user_approval, InputType
 from ..codebase_concatenator import CodebaseConcatenator, get_config
 from ..codebase_concatenator.concatenator import CodebaseConcatenator
 from ..shared_utils.project_summarizer import ProjectSummarizer
-from ..llm_providers import get_provider
+from ..llm_providers import get_provider, llm_stage
+from ..llm_providers.providers.utils import cacheable_text
 from ..llm_providers.providers.exceptions import OverloadedError
 from rich.console import Console
 from anthropic import Anthropic
@@ -160,26 +161,34 @@ class SmartContextBuilder:
         self.logger.info("Selecting relevant files using LLM")
         declarations_context = self._format_declarations_for_llm()
         summary_context = self._project_summarizer.format_summary_for_llm()
-        prompt = f"""Given the following project summary, file declarations, and a user request, select the most relevant files for the context:
-
-Project Summary:
-{summary_context}
-
-File Declarations:
-{declarations_context}
-
-User Request: "{user_request}"
+        # Static instructions and the large summaries/declarations block go first and are marked
+        # for prompt caching; only the user request at the end changes between calls.
+        instructions = """Given the following project summary, file declarations, and a user request, select the most relevant files for the context.
 
 Return ONLY a comma-separated list of file names (not full paths) that are most relevant to the user request. Do not return anything else than the list of files.
 
 Make sure to include any file that is relevant or potentially relevant, or loosly related to the user request. It's better to select more files than less.
 
 IF we need file from a module in src/modules/, includes 100% of all the files in this module.
+"""
+        project_context = f"""
+Project Summary:
+{summary_context}
 
-
-
+File Declarations:
+{declarations_context}
+"""
+        request = f"""
+User Request: "{user_request}"
 """
-        response = self._llm_provider.generate_response([{"role": "user", "content": prompt}])
+        content = [
+            {"type": "text", "text": instructions},
+            cacheable_text(project_context),
+            {"type": "text", "text": request},
+        ]
+        prompt = instructions + project_context + request
+        with llm_stage("selection"):
+            response = self._llm_provider.generate_response([{"role": "user", "content": content}])
         self.logger.info(f"LLM response for file selection: {response}")
         response_files = [file.strip() for file in response.split(',')]
 
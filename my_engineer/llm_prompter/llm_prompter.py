@@ -8,15 +8,17 @@ class LLMPrompter:
         self.logger = setup_logger("LLMPrompter")
         self._chat_engine = ChatEngine(provider_name, run_dir)
 
-    def generate_instructions(self, conversation_state: ConversationState, user_prompt: str) -> str:
+    def generate_instructions(self, conversation_state: ConversationState, user_prompt: str, on_instruction=None) -> str:
         """
         Generate instructions based on the given conversation state.
         Args:
             conversation_state (ConversationState): The current state of the conversation.
             user_prompt (str): The user's prompt or request.
+            on_instruction (callable, optional): Called with each instruction as soon as it is complete
+                when responses are streamed.
         Returns:
             str: Generated instructions.
         """
         self.logger.debug("Generating instructions in LLMPrompter")
         self.logger.debug(f"User prompt: {user_prompt[:100]}...")  # Log first 100 chars of user prompt
-        return self._chat_engine.get_raw_instructions(conversation_state, user_prompt)
\ No newline at end of file
+        return self._chat_engine.get_raw_instructions(conversation_state, user_prompt, on_instruction)
\ No newline at end of file
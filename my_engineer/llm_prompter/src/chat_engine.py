@@ -1,17 +1,27 @@
+import os
 import json
 from typing import List, Dict, Optional
-from ...llm_providers import get_provider
+from ...llm_providers import get_provider, llm_stage
 from ...llm_providers import Settings
 from ...llm_providers.providers.exceptions import OverloadedError
 from ...llm_providers.providers.utils import log_llm_request
+from ...llm_providers.providers.cache_planner import record_cache_usage
 from .context_utils import get_context
+from .conversation_window import ConversationWindow
+from .tool_instructions import ToolInstructionSession
 from ...shared_models.chat_models import Message, ConversationState, MessageContent
+from ...shared_models.llm_response.instruction_stream import InstructionStream
 from ...shared_utils.logger import setup_logger
+from ...shared_utils.config import get_config
 from colorama import Fore, init
 from rich.console import Console
 from rich.spinner import Spinner
 init(autoreset=True)
 
+# "text": instructions are ###PATCH / ###NEW / ###BASH blocks in the answer. "tools": they are tool calls,
+# validated one by one, and rendered back to the same text form.
+INSTRUCTION_MODE = os.getenv("INSTRUCTION_MODE", "text").lower()
+
 class ChatEngine:
     def __init__(self, provider_name: str, run_dir: str = None):
         self.llm_provider = get_provider(provider_name, run_dir)
@@ -19,8 +29,9 @@ class ChatEngine:
         self.settings = Settings()
         self.console = Console()
         self.run_dir = run_dir
+        self.conversation_window = ConversationWindow()
 
-    def get_raw_instructions(self, conversation_state: ConversationState, user_prompt: str) -> str:
+    def get_raw_instructions(self, conversation_state: ConversationState, user_prompt: str, on_instruction=None) -> str:
         try:
             assert self.run_dir, "run_dir must be provided when initializing ChatEngine"
             if not conversation_state.message_sequence.messages:
@@ -29,14 +40,28 @@ class ChatEngine:
             self.logger.debug(f"Prepared messages: {json.dumps(messages, indent=2)}")
 
             log_llm_request(self.llm_provider.model)
-            with self.console.status("[bold green]Sending request to LLM...", spinner="dots") as status:
-                response = self.llm_provider.generate_response(messages)
-                status.update("[bold green]Request completed!")
-                self.console.print("[bold green]Response received from LLM.")
+            usage = None
+            with llm_stage("instructions"):
+                if INSTRUCTION_MODE == "tools":
+                    with self.console.status("[bold green]Requesting instructions through tool calls...", spinner="dots"):
+                        session = ToolInstructionSession(self.llm_provider)
+                        response = session.run(messages, on_instruction)
+                        # Every round of tool calls counts, not only the last request
+                        usage = session.usage
+                    self.console.print("[bold green]Instructions received from LLM.")
+                elif get_config().stream_responses:
+                    response = self._stream_response(messages, on_instruction)
+                else:
+                    with self.console.status("[bold green]Sending request to LLM...", spinner="dots") as status:
+                        response = self.llm_provider.generate_response(messages)
+                        status.update("[bold green]Request completed!")
+                        self.console.print("[bold green]Response received from LLM.")
 
             if not isinstance(response, str) or not response.strip():
                 raise ValueError("Received an empty or invalid response from the LLM provider")
 
+            record_cache_usage(self.run_dir, conversation_state.turn_number, usage or getattr(self.llm_provider, "last_usage", None))
+
             conversation_state.message_sequence.messages.append(Message(role="user", content=user_prompt))
             conversation_state.message_sequence.messages.append(Message(role="assistant", content=response))
 
@@ -48,6 +73,19 @@ class ChatEngine:
             self.logger.error(f"Error getting raw instructions: {str(e)}")
             raise
 
+    def _stream_response(self, messages: List[Dict[str, str]], on_instruction=None) -> str:
+        instruction_stream = InstructionStream(on_instruction)
+
+        def on_text(text: str):
+            self.console.print(text, end="", markup=False, highlight=False)
+            instruction_stream.feed(text)
+
+        response = self.llm_provider.generate_response(messages, on_text=on_text)
+        instruction_stream.close()
+        self.console.print()
+        self.console.print(f"[bold green]Response streamed from LLM ({instruction_stream.instruction_count} instructions).")
+        return response
+
     def initialize_conversation_state(self, conversation_state: ConversationState, include_tests: bool = False, user_request: str = "") -> None:
         assert self.run_dir, "run_dir must be provided when initializing ChatEngine"
         assert user_request != "", "user_request must exist"
@@ -76,16 +114,8 @@ class ChatEngine:
         conversation_state.message_sequence.messages.append(assistant_message)
         self.logger.info(Fore.BLUE + f"Initialized conversation state with cached context.")
 
-    def prepare_messages(self, conversation_state: ConversationState, user_prompt: str) -> List[Dict[str, str]]:
-        messages = []
-        for msg in conversation_state.message_sequence.messages:
-            if isinstance(msg.content, list):
-                content = " ".join(item.text for item in msg.content if item.type == "text")
-            else:
-                content = msg.content
-            messages.append({"role": msg.role, "content": content})
-        messages.append({"role": "user", "content": user_prompt})
-        return messages
+    def prepare_messages(self, conversation_state: ConversationState, user_prompt: str) -> List[Dict]:
+        return self.conversation_window.build_messages(conversation_state, user_prompt)
 
     def set_run_dir(self, run_dir: str):
         self.run_dir = run_dir
\ No newline at end of file
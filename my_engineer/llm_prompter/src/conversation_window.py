@@ -0,0 +1,135 @@
+import os
+import re
+from typing import Dict, List, Optional
+from ...shared_models.chat_models import ConversationState, Message
+from ...shared_utils.logger import setup_logger
+
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", 150000))
+CONVERSATION_KEEP_RECENT_TURNS = int(os.getenv("CONVERSATION_KEEP_RECENT_TURNS", 2))
+
+INSTRUCTION_HEADER = re.compile(r'^###\s*(PATCH|NEW|BASH)\s*:\s*(.+?)\s*$')
+INITIAL_MESSAGES = 2  # Context message and its acknowledgement
+
+
+def _summarize_block(header: Optional[re.Match], body: List[str]) -> str:
+    if header is None:
+        return f"[Code block omitted: {len(body)} lines]"
+    kind, path = header.group(1), header.group(2)
+    if kind == "PATCH":
+        added = sum(1 for line in body if line.startswith('+') and not line.startswith('+++'))
+        removed = sum(1 for line in body if line.startswith('-') and not line.startswith('---'))
+        return f"[Earlier PATCH for {path}: +{added}/-{removed} lines, omitted]"
+    if kind == "NEW":
+        return f"[Earlier NEW file {path}: {len(body)} lines, omitted]"
+    return f"[Earlier BASH script {path}: {len(body)} lines, omitted]"
+
+
+def compress_assistant_text(text: str) -> str:
+    """
+    Replace the fenced blocks of an earlier answer (patches, new files, scripts, code samples)
+    with a one-line summary, keeping the surrounding explanations. Deterministic, so a compressed
+    message is byte-identical on every turn and stays in the prompt cache.
+    """
+    lines = text.split('\n')
+    output = []
+    header = None
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        if line.strip().startswith('```'):
+            end = next((j for j in range(index + 1, len(lines)) if lines[j].strip().startswith('```')), None)
+            if end is None:
+                output.extend(lines[index:])
+                break
+            output.append(_summarize_block(header, lines[index + 1:end]))
+            header = None
+            index = end + 1
+            continue
+        if header is not None:
+            output.append(header.group(0))
+            header = None
+        match = INSTRUCTION_HEADER.match(line.strip())
+        if match:
+            header = match
+        else:
+            output.append(line)
+        index += 1
+    if header is not None:
+        output.append(header.group(0))
+    return '\n'.join(output)
+
+
+def _to_api_message(message: Message, compress: bool = False) -> Dict:
+    if isinstance(message.content, list):
+        # Keep the structured blocks as-is so the prompt-cache prefix stays byte-stable across turns
+        content = [{"type": "text", "text": item.text} for item in message.content if item.type == "text"]
+        if compress:
+            content = [{"type": "text", "text": compress_assistant_text(block["text"])} for block in content]
+    else:
+        content = compress_assistant_text(message.content) if compress else message.content
+    return {"role": message.role, "content": content}
+
+
+def estimate_tokens(messages: List[Dict]) -> int:
+    total = 0
+    for message in messages:
+        content = message["content"]
+        total += len(content) if isinstance(content, str) else sum(len(block.get("text", "")) for block in content)
+    return total // 4
+
+
+class ConversationWindow:
+    """
+    Chooses what part of the conversation is sent to the LLM, within a token budget.
+
+    The context message and the most recent turns are always sent verbatim. When the conversation
+    outgrows CONVERSATION_TOKEN_BUDGET, every older turn is compacted at once: its assistant answer
+    loses its code blocks (already applied) and keeps only the explanations. If that is not enough,
+    the oldest turns are left out. Both boundaries are stored on the ConversationState and only move
+    when the budget is exceeded again, so the prompt prefix stays identical between compactions
+    and keeps hitting the prompt cache.
+    """
+
+    def __init__(self, token_budget: Optional[int] = None, keep_recent_turns: Optional[int] = None):
+        self.token_budget = token_budget if token_budget is not None else CONVERSATION_TOKEN_BUDGET
+        self.keep_recent_turns = keep_recent_turns if keep_recent_turns is not None else CONVERSATION_KEEP_RECENT_TURNS
+        self.logger = setup_logger("ConversationWindow")
+
+    def _render(self, conversation_state: ConversationState, user_prompt: str) -> List[Dict]:
+        messages = conversation_state.message_sequence.messages
+        head = [_to_api_message(message) for message in messages[:INITIAL_MESSAGES]]
+        history = messages[INITIAL_MESSAGES:]
+        dropped = conversation_state.dropped_message_count
+        compacted = conversation_state.compacted_message_count
+        window = head
+        window += [_to_api_message(message, compress=message.role == "assistant") for message in history[dropped:compacted]]
+        window += [_to_api_message(message) for message in history[max(compacted, dropped):]]
+        window.append({"role": "user", "content": user_prompt})
+        return window
+
+    def build_messages(self, conversation_state: ConversationState, user_prompt: str) -> List[Dict]:
+        messages = self._render(conversation_state, user_prompt)
+        tokens = estimate_tokens(messages)
+        if tokens <= self.token_budget:
+            return messages
+
+        history_length = len(conversation_state.message_sequence.messages) - INITIAL_MESSAGES
+        # Turns are user/assistant pairs, so boundaries stay on even indexes
+        boundary = max(0, history_length - 2 * self.keep_recent_turns)
+        if boundary > conversation_state.compacted_message_count:
+            conversation_state.compacted_message_count = boundary
+            messages = self._render(conversation_state, user_prompt)
+            self.logger.info(f"Conversation over budget ({tokens} > {self.token_budget} tokens), compacted {boundary} earlier messages")
+            tokens = estimate_tokens(messages)
+
+        dropped_before = conversation_state.dropped_message_count
+        while tokens > self.token_budget and conversation_state.dropped_message_count < conversation_state.compacted_message_count:
+            conversation_state.dropped_message_count += 2
+            messages = self._render(conversation_state, user_prompt)
+            tokens = estimate_tokens(messages)
+        if conversation_state.dropped_message_count > dropped_before:
+            self.logger.info(f"Leaving out the {conversation_state.dropped_message_count} oldest messages to stay within budget")
+
+        if tokens > self.token_budget:
+            self.logger.warning(f"Conversation still over budget after compaction: {tokens} > {self.token_budget} tokens")
+        return messages
@@ -0,0 +1,182 @@
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional, Union
+from pydantic import ValidationError
+from ...llm_providers.providers.continuation import merge_usage
+from ...shared_models.llm_response.llm_response_models import PatchInstruction, NewFileInstruction, BashScriptInstruction
+from ...shared_utils.logger import setup_logger
+
+Instruction = Union[PatchInstruction, NewFileInstruction, BashScriptInstruction]
+
+# Requests per answer: the first one, then one per batch of tool results (acknowledgements and corrections)
+TOOL_MAX_ROUNDS = int(os.getenv("INSTRUCTION_TOOL_MAX_ROUNDS", 4))
+
+TOOL_MODE_SYSTEM_PROMPT = (
+    "Make every change through the tools: patch_file for changes to existing files (a diff using + and - lines), "
+    "new_file for new files, bash_script for other operations such as moving or deleting files. "
+    "Do not write ###PATCH, ###NEW or ###BASH blocks. Keep the explanations and the ###COMMIT line in your text. "
+    "When a tool result reports an error, call the tool again for that item only."
+)
+
+INSTRUCTION_TOOLS = [
+    {
+        "name": "patch_file",
+        "description": "Change an existing file with a diff style patch, using + and - lines with a few lines of context.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "file_path": {"type": "string", "description": "Path of the file, relative to the project root"},
+                "patch_content": {"type": "string", "description": "The patch, without code fences"},
+            },
+            "required": ["file_path", "patch_content"],
+        },
+    },
+    {
+        "name": "new_file",
+        "description": "Create a new file with its complete content.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "file_path": {"type": "string", "description": "Path of the file, relative to the project root"},
+                "content": {"type": "string", "description": "The complete file content, without code fences"},
+            },
+            "required": ["file_path", "content"],
+        },
+    },
+    {
+        "name": "bash_script",
+        "description": "A bash script for operations other than editing files, such as moving or deleting them.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "script_name": {"type": "string", "description": "File name of the script, e.g. move_files.sh"},
+                "script_content": {"type": "string", "description": "The script, without code fences"},
+            },
+            "required": ["script_name", "script_content"],
+        },
+    },
+]
+
+TOOL_MODELS = {"patch_file": PatchInstruction, "new_file": NewFileInstruction, "bash_script": BashScriptInstruction}
+SEARCH_MARKER = re.compile(r'^<{5,}\s*SEARCH\s*$', re.MULTILINE)
+
+
+def _check_path(path: str) -> None:
+    if not path.strip() or any(character.isspace() for character in path):
+        raise ValueError(f"Invalid path {path!r}: it must be non-empty and contain no spaces")
+    if os.path.isabs(path) or '..' in path.replace('\\', '/').split('/'):
+        raise ValueError(f"Invalid path {path!r}: it must be relative to the project root")
+
+
+def _unfence(content: str) -> str:
+    """Remove a code fence wrapping the whole content, which the tool inputs should not have."""
+    lines = content.strip('\n').split('\n')
+    if len(lines) >= 2 and lines[0].strip().startswith('```') and lines[-1].strip().startswith('```'):
+        return '\n'.join(lines[1:-1])
+    return content
+
+
+def validate_tool_call(name: str, tool_input: Dict[str, Any]) -> Instruction:
+    """Turn a tool call into its instruction. Raises ValueError describing what is wrong with it."""
+    if name not in TOOL_MODELS:
+        raise ValueError(f"Unknown tool {name!r}. Use one of: {', '.join(TOOL_MODELS)}")
+    try:
+        instruction = TOOL_MODELS[name](**tool_input)
+    except (ValidationError, TypeError) as e:
+        raise ValueError(f"Invalid {name} input: {str(e)}")
+
+    if isinstance(instruction, PatchInstruction):
+        _check_path(instruction.file_path)
+        instruction.patch_content = _unfence(instruction.patch_content)
+        changed = [line for line in instruction.patch_content.split('\n')
+                   if line[:1] in ('+', '-') and not line.startswith(('+++', '---'))]
+        if not changed and not SEARCH_MARKER.search(instruction.patch_content):
+            raise ValueError(f"Invalid patch for {instruction.file_path}: it has no + or - lines")
+    elif isinstance(instruction, NewFileInstruction):
+        _check_path(instruction.file_path)
+        instruction.content = _unfence(instruction.content)
+    else:
+        _check_path(instruction.script_name)
+        instruction.script_content = _unfence(instruction.script_content)
+        if not instruction.script_content.strip():
+            raise ValueError(f"Invalid bash script {instruction.script_name}: it is empty")
+    return instruction
+
+
+def _fence_for(content: str) -> str:
+    longest = max((len(run) for run in re.findall(r'`+', content)), default=0)
+    return '`' * max(3, longest + 1)
+
+
+def render_instructions(text: str, instructions: List[Instruction]) -> str:
+    """The answer in the ###PATCH / ###NEW / ###BASH text form the rest of the pipeline and the conversation use."""
+    parts = [text.strip()] if text.strip() else []
+    for instruction in instructions:
+        if isinstance(instruction, PatchInstruction):
+            header, content = f"###PATCH: {instruction.file_path}", instruction.patch_content
+        elif isinstance(instruction, NewFileInstruction):
+            header, content = f"###NEW: {instruction.file_path}", instruction.content
+        else:
+            header, content = f"###BASH: {instruction.script_name}", instruction.script_content
+        fence = _fence_for(content)
+        parts.append(f"{header}\n{fence}\n{content}\n{fence}")
+    return '\n'.join(parts)
+
+
+class ToolInstructionSession:
+    """
+    Gets the instructions of one answer through tool calls instead of ### blocks.
+
+    Every tool call is validated as soon as its response arrives and valid ones are handed to
+    `on_instruction`. Invalid calls get an error tool_result naming the problem, so the model only
+    re-sends those items; valid ones are acknowledged. This continues while the model keeps calling
+    tools or errors remain, up to INSTRUCTION_TOOL_MAX_ROUNDS requests. `usage` is summed over
+    every request of the answer.
+    """
+
+    def __init__(self, provider, max_rounds: int = TOOL_MAX_ROUNDS):
+        self.provider = provider
+        self.max_rounds = max_rounds
+        self.logger = setup_logger("ToolInstructionSession")
+        self.rejected_calls = 0
+        self.usage: Optional[Dict[str, int]] = None
+
+    def run(self, messages: List[Dict], on_instruction: Optional[Callable[[Instruction], None]] = None) -> str:
+        messages = list(messages)
+        texts: List[str] = []
+        instructions: List[Instruction] = []
+        for round_number in range(1, self.max_rounds + 1):
+            response = self.provider.generate_tool_response(messages, INSTRUCTION_TOOLS, system_prompt=TOOL_MODE_SYSTEM_PROMPT)
+            if getattr(self.provider, "last_usage", None):
+                self.usage = merge_usage(self.usage, self.provider.last_usage)
+            results = []
+            for block in response["content"]:
+                if block["type"] == "text":
+                    texts.append(block["text"])
+                    continue
+                if block["type"] != "tool_use":
+                    continue
+                try:
+                    instruction = validate_tool_call(block["name"], block["input"])
+                except ValueError as e:
+                    self.rejected_calls += 1
+                    self.logger.warning(f"Rejected {block['name']} call: {str(e)}")
+                    results.append({"type": "tool_result", "tool_use_id": block["id"], "is_error": True,
+                                    "content": f"{str(e)}. Call {block['name']} again for this item, corrected. The other items were accepted."})
+                    continue
+                instructions.append(instruction)
+                if on_instruction:
+                    on_instruction(instruction)
+                results.append({"type": "tool_result", "tool_use_id": block["id"], "content": "Accepted."})
+
+            has_errors = any(result.get("is_error") for result in results)
+            if not results or (response["stop_reason"] != "tool_use" and not has_errors):
+                break
+            if round_number == self.max_rounds:
+                if has_errors:
+                    self.logger.warning(f"Some tool calls were still invalid after {self.max_rounds} requests and were dropped")
+                break
+            messages += [{"role": "assistant", "content": response["content"]}, {"role": "user", "content": results}]
+
+        self.logger.info(f"Received {len(instructions)} instructions through tool calls ({self.rejected_calls} rejected)")
+        return render_instructions('\n'.join(texts), instructions)
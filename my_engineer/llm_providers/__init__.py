@@ -1,4 +1,7 @@
-from .providers import get_provider, LLMProvider, ClaudeProvider, HaikuProvider
+from .providers import get_provider, register_provider, LLMProvider, ClaudeProvider, HaikuProvider, StubProvider
+from .providers import run_sync, run_concurrently, gather_with_concurrency
+from .providers import get_scheduler, get_hedger
+from .providers import llm_stage, aggregate_usage, print_usage_report
 from .providers.utils import Settings, get_max_tokens, prepare_messages, log_usage
 
-__all__ = ['LLMProvider', 'ClaudeProvider', 'get_provider', 'setup_logging', 'HaikuProvider', 'Settings']
\ No newline at end of file
+__all__ = ['LLMProvider', 'ClaudeProvider', 'get_provider', 'setup_logging', 'HaikuProvider', 'StubProvider', 'register_provider', 'Settings', 'get_scheduler', 'get_hedger', 'run_sync', 'run_concurrently', 'gather_with_concurrency', 'llm_stage', 'aggregate_usage', 'print_usage_report']
\ No newline at end of file
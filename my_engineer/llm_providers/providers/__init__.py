@@ -1,8 +1,14 @@
 from .claude_provider import ClaudeProvider
-from .factory import get_provider
+from .factory import get_provider, register_provider
 from .base_provider import LLMProvider
 from .haiku_provider import HaikuProvider
-from .utils import prepare_messages
+from .stub_provider import StubProvider
+from .utils import prepare_messages, cacheable_text
+from .scheduler import get_scheduler, RequestScheduler, CallTicket
+from .async_utils import run_sync, run_concurrently, gather_with_concurrency
+from .telemetry import llm_stage, CallTelemetry, LLMCallRecord
+from .hedging import get_hedger, RequestHedger
+from .usage_report import aggregate_usage, print_usage_report
 
 
 __all__ = [
@@ -12,5 +18,21 @@ __all__ = [
     "get_provider",
     "setup_logging",
     "HaikuProvider",
+    "StubProvider",
+    "register_provider",
     "prepare_messages",
+    "cacheable_text",
+    "get_scheduler",
+    "RequestScheduler",
+    "CallTicket",
+    "run_sync",
+    "run_concurrently",
+    "gather_with_concurrency",
+    "llm_stage",
+    "get_hedger",
+    "RequestHedger",
+    "CallTelemetry",
+    "LLMCallRecord",
+    "aggregate_usage",
+    "print_usage_report",
 ]
@@ -0,0 +1,65 @@
+import os
+import asyncio
+import contextvars
+import threading
+from typing import Awaitable, Iterable, List
+
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 4))
+
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Return the background event loop shared by every provider call, starting it on first use."""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="llm-event-loop", daemon=True)
+            _loop_thread.start()
+    return _loop
+
+
+def run_sync(coro: Awaitable):
+    """
+    Run a coroutine on the shared event loop and block until it completes.
+
+    Using a single long-lived loop lets the async SDK clients keep their connection pools
+    between calls, and makes this safe to call from threads that already run their own loop.
+    Context variables of the caller are carried over to the coroutine.
+    """
+    loop = get_event_loop()
+    if threading.current_thread() is _loop_thread:
+        coro.close()
+        raise RuntimeError("run_sync cannot be called from the LLM event loop, await the coroutine instead")
+    context = contextvars.copy_context()
+
+    async def _run_in_caller_context():
+        for var, value in context.items():
+            var.set(value)
+        return await coro
+
+    future = asyncio.run_coroutine_threadsafe(_run_in_caller_context(), loop)
+    try:
+        return future.result()
+    except BaseException:
+        future.cancel()
+        raise
+
+
+async def gather_with_concurrency(coros: Iterable[Awaitable], limit: int = LLM_CONCURRENCY, return_exceptions: bool = False) -> List:
+    """Await independent calls concurrently, at most `limit` at a time. Results keep the input order."""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def _bounded(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(_bounded(coro) for coro in coros), return_exceptions=return_exceptions)
+
+
+def run_concurrently(coros: Iterable[Awaitable], limit: int = LLM_CONCURRENCY, return_exceptions: bool = False) -> List:
+    """Synchronous entry point for pipeline stages that fan out independent LLM calls."""
+    return run_sync(gather_with_concurrency(list(coros), limit, return_exceptions))
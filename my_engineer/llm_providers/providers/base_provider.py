@@ -1,6 +1,20 @@
 from abc import ABC, abstractmethod
+from .async_utils import run_sync
 
 class LLMProvider(ABC):
     @abstractmethod
-    def generate_response(self, messages, system_prompt=None):
-        pass
\ No newline at end of file
+    async def generate_response_async(self, messages, system_prompt=None, on_text=None):
+        pass
+
+    def generate_response(self, messages, system_prompt=None, on_text=None):
+        return run_sync(self.generate_response_async(messages, system_prompt, on_text))
+
+    async def generate_tool_response_async(self, messages, tools, system_prompt=None):
+        """
+        Send a request offering `tools`. Returns {"content": [...], "stop_reason": ...}, the content
+        being text ({"type": "text", "text"}) and tool_use ({"type": "tool_use", "id", "name", "input"}) blocks.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support tool use")
+
+    def generate_tool_response(self, messages, tools, system_prompt=None):
+        return run_sync(self.generate_tool_response_async(messages, tools, system_prompt))
@@ -0,0 +1,108 @@
+import os
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from .utils import to_content_blocks
+from ...shared_utils.logger import setup_logger
+
+MAX_CACHE_BREAKPOINTS = 4
+EPHEMERAL = {"type": "ephemeral"}
+PROMPT_CACHE_USAGE_FILE = "prompt_cache_usage.jsonl"
+
+logger = setup_logger("cache_planner")
+
+
+def _text_tokens(blocks: List[Dict[str, Any]]) -> int:
+    return sum(len(block.get("text", "")) for block in blocks) // 4
+
+
+class CacheBreakpointPlanner:
+    """
+    Places prompt-cache breakpoints on the stable prefix of a conversation request.
+
+    In priority order: the system prompt, the initial context message, the new user turn
+    (so the next turn can read everything up to it) and the previous user turn (the prefix
+    written by the last request). Breakpoints whose prefix is shorter than the model's
+    minimum cacheable length are skipped, since the API would ignore them.
+    Requests that already carry caller-placed breakpoints keep them instead.
+    """
+
+    def __init__(self, min_prefix_tokens: int = 1024, max_breakpoints: int = MAX_CACHE_BREAKPOINTS):
+        self.min_prefix_tokens = min_prefix_tokens
+        self.max_breakpoints = max_breakpoints
+
+    def apply(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        system = request_data.get("system")
+        system_blocks = to_content_blocks(system) if system else []
+        messages = [{"role": msg["role"], "content": to_content_blocks(msg["content"])} for msg in request_data["messages"]]
+        if any("cache_control" in block for block in system_blocks + [block for msg in messages for block in msg["content"]]):
+            return self.enforce_limits(request_data)
+
+        prefix_tokens = [_text_tokens(system_blocks)]
+        for msg in messages:
+            prefix_tokens.append(prefix_tokens[-1] + _text_tokens(msg["content"]))
+
+        last = len(messages) - 1
+        candidates = []  # (blocks, prefix tokens through these blocks)
+        if system_blocks:
+            candidates.append((system_blocks, prefix_tokens[0]))
+        for index in (0, last, last - 2):
+            if 0 <= index <= last and all(blocks is not messages[index]["content"] for blocks, _ in candidates):
+                candidates.append((messages[index]["content"], prefix_tokens[index + 1]))
+
+        placed = 0
+        for blocks, tokens in candidates:
+            if placed >= self.max_breakpoints or tokens < self.min_prefix_tokens or not blocks:
+                continue
+            blocks[-1]["cache_control"] = dict(EPHEMERAL)
+            placed += 1
+
+        if system_blocks:
+            request_data["system"] = system_blocks
+        request_data["messages"] = messages
+        return request_data
+
+    def enforce_limits(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Keep only the caller-placed breakpoints that can take effect: at most `max_breakpoints`,
+        each closing a prefix long enough to be cached.
+        """
+        system = request_data.get("system")
+        system_blocks = to_content_blocks(system) if system else []
+        messages = [{"role": msg["role"], "content": to_content_blocks(msg["content"])} for msg in request_data["messages"]]
+        prefix_tokens = 0
+        placed = 0
+        for block in system_blocks + [block for msg in messages for block in msg["content"]]:
+            prefix_tokens += len(block.get("text", "")) // 4
+            if "cache_control" not in block:
+                continue
+            if prefix_tokens < self.min_prefix_tokens or placed >= self.max_breakpoints:
+                del block["cache_control"]
+            else:
+                placed += 1
+        if system_blocks:
+            request_data["system"] = system_blocks
+        request_data["messages"] = messages
+        return request_data
+
+
+def record_cache_usage(run_dir: Optional[str], turn_number: int, usage: Optional[Dict[str, int]]) -> Optional[Dict[str, Any]]:
+    """Append the prompt-cache usage of one conversation turn to the run directory and log its hit rate."""
+    if not usage:
+        return None
+    cache_read = usage.get("cache_read_input_tokens", 0)
+    cache_creation = usage.get("cache_creation_input_tokens", 0)
+    total_input = cache_read + cache_creation + usage.get("input_tokens", 0)
+    record = {
+        "timestamp": datetime.now().isoformat(),
+        "turn": turn_number,
+        "input_tokens": usage.get("input_tokens", 0),
+        "cache_creation_input_tokens": cache_creation,
+        "cache_read_input_tokens": cache_read,
+        "cache_hit_rate": round(cache_read / total_input, 4) if total_input else 0.0,
+    }
+    logger.info(f"Prompt cache turn {turn_number}: read {cache_read}, written {cache_creation}, hit rate {record['cache_hit_rate']:.0%}")
+    if run_dir:
+        with open(os.path.join(run_dir, PROMPT_CACHE_USAGE_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + "\n")
+    return record
@@ -1,65 +1,135 @@
 import os
 import time
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 from .base_provider import LLMProvider
-from .utils import get_max_tokens, prepare_messages, log_usage
+from .utils import get_max_tokens, get_min_cache_tokens, prepare_messages, log_usage, estimate_request_tokens
 import json
 from datetime import datetime
 from pprint import pformat
 from rich.console import Console
 from .exceptions import OverloadedError
+from .scheduler import get_scheduler, CallTicket
+from .response_cache import get_response_cache
+from .cache_planner import CacheBreakpointPlanner
+from .telemetry import CallTelemetry
+from .hedging import get_hedger
+from .continuation import send_with_continuations
+from .request_log_store import get_request_log_store, REQUEST_LOG_FILE
 from ...shared_utils.logger import setup_logger
 
 
 class ClaudeProvider(LLMProvider):
     def __init__(self, run_dir):
-        self.client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        self.client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), max_retries=0)
         self.model = os.getenv("CLAUDE_MODEL", "claude-3-5-sonnet-20240620")
         self.max_tokens = get_max_tokens(self.model)
         self.console = Console()
         self.run_dir = run_dir
         self.logger = setup_logger("ClaudeProvider")
+        self.cache_planner = CacheBreakpointPlanner(min_prefix_tokens=get_min_cache_tokens(self.model))
+        self.last_usage = None
 
     def _prepare_request_data(self, messages, system_prompt=None):
         request_data = self._initialize_request_data(system_prompt)
         processed_messages = self._process_messages(messages)
         request_data["messages"] = processed_messages
-        return request_data
+        return self.cache_planner.apply(request_data)
 
-    def generate_response(self, messages, system_prompt=None):
+    async def generate_response_async(self, messages, system_prompt=None, on_text=None):
         request_data = self._prepare_request_data(messages, system_prompt)
         self._validate_request_data(request_data)
-        return self._send_request_and_process_response(request_data)
+        return await self._send_request_and_process_response(request_data, on_text)
 
-    def _send_request_and_process_response(self, request_data):
+    async def generate_tool_response_async(self, messages, tools, system_prompt=None):
+        request_data = self._prepare_request_data(messages, system_prompt)
+        self._validate_request_data(request_data)
+        request_data["tools"] = tools
+        telemetry = CallTelemetry("claude", self.model)
         try:
+            # Not served from the response cache, which only stores text answers
             self._log_request(request_data)
-            response = self._make_api_call(request_data)
-            return self._process_response(response, request_data)
+            self.last_usage = None
+            response = await self._schedule_api_call(request_data, telemetry=telemetry)
+            self.last_usage = log_usage(response.usage)
+            telemetry.finish(self.run_dir, usage=self.last_usage)
+            content = []
+            for block in response.content:
+                if block.type == "text":
+                    content.append({"type": "text", "text": block.text})
+                elif block.type == "tool_use":
+                    content.append({"type": "tool_use", "id": block.id, "name": block.name, "input": block.input})
+            return {"content": content, "stop_reason": response.stop_reason}
         except Exception as e:
+            telemetry.finish(self.run_dir, error=e)
             self._handle_error(e)
 
+    async def _send_request_and_process_response(self, request_data, on_text=None):
+        telemetry = CallTelemetry("claude", self.model)
+        try:
+            self._log_request(request_data)
+            self.last_usage = None
+            cached = get_response_cache().get(request_data)
+            if cached is not None:
+                if on_text:
+                    on_text(cached["text"])
+                telemetry.finish(self.run_dir, cached_response=True)
+                return cached["text"]
+            text, self.last_usage = await send_with_continuations(
+                request_data, lambda data: self._send_once(data, on_text, telemetry), telemetry)
+            if not text:
+                raise ValueError("Received an empty response from Claude")
+            get_response_cache().put(request_data, text, self.last_usage)
+            telemetry.finish(self.run_dir, usage=self.last_usage)
+            return text
+        except Exception as e:
+            telemetry.finish(self.run_dir, error=e)
+            self._handle_error(e)
+
+    async def _send_once(self, request_data, on_text, telemetry):
+        response = await self._schedule_api_call(request_data, on_text, telemetry)
+        return self._process_response(response, request_data), response.stop_reason, log_usage(response.usage)
+
     def _log_request(self, request_data):
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        log_filename = f"llm_request_{timestamp}.json"
-        log_filepath = os.path.join(self.run_dir, log_filename)
-        self.logger.info(f"Run directory: {self.run_dir}")
-        self.logger.info(f"Complete LLM request logged to: {log_filepath}")
-        self.console.print(f"[bold blue]Complete LLM request logged to: {log_filepath}[/bold blue]")
-        with open(log_filepath, 'a') as log_file:
-            json.dump(request_data, log_file, indent=2)
-
-    def _make_api_call(self, request_data):
-        response = self.client.messages.create(**request_data)
+        record_id = get_request_log_store().log(self.run_dir, "claude", request_data)
+        self.logger.info(f"LLM request {record_id} logged to: {os.path.join(self.run_dir, REQUEST_LOG_FILE)}")
+
+    async def _schedule_api_call(self, request_data, on_text=None, telemetry=None):
+        streamed = []
+
+        def record_text(text):
+            if telemetry:
+                telemetry.mark_first_token()
+            streamed.append(text)
+            on_text(text)
+
+        ticket = telemetry.ticket if telemetry else CallTicket()
+        return await get_hedger().run(
+            self.model,
+            lambda attempt_on_text: get_scheduler().submit(
+                self.model,
+                lambda: self._make_api_call(request_data, attempt_on_text),
+                estimated_tokens=estimate_request_tokens(request_data),
+                ticket=ticket,
+                can_retry=lambda: not streamed,
+            ),
+            record_text if on_text else None,
+            telemetry,
+        )
+
+    async def _make_api_call(self, request_data, on_text=None):
+        if on_text is None:
+            response = await self.client.messages.create(**request_data)
+        else:
+            async with self.client.messages.stream(**request_data) as stream:
+                async for text in stream.text_stream:
+                    on_text(text)
+                response = await stream.get_final_message()
         self.console.print("[bold green]Response received from Claude Sonnet.[/bold green]")
         return response
 
     def _process_response(self, response, request_data):
-        response_data = response.model_dump()
-        log_usage(response.usage)
-        if not response.content:
-            raise ValueError("Received an empty response from Claude")
-        return response.content[0].text
+        # A continuation may legitimately be empty, so emptiness is checked on the stitched text
+        return "".join(block.text for block in response.content if block.type == "text")
 
     def _handle_error(self, error):
         self.console.print("[bold red]Error while communicating with Claude Sonnet.[/bold red]")
@@ -82,18 +152,7 @@ class ClaudeProvider(LLMProvider):
         prepared_messages = prepare_messages(messages)
         if not prepared_messages:
             raise ValueError("No valid messages provided")
-        
-        return [self._process_single_message(msg, i, len(prepared_messages))
-                for i, msg in enumerate(prepared_messages)]
-
-    def _process_single_message(self, msg, index, total_messages):
-        content = self._apply_cache_control(msg["content"], index, total_messages)
-        return {"role": msg["role"], "content": content}
-
-    def _apply_cache_control(self, message, index, total_messages):
-        if index >= total_messages - 4:
-            return [{"type": "text", "text": message, "cache_control": {"type": "ephemeral"}}]
-        return [{"type": "text", "text": message}]
+        return prepared_messages
 
     def _validate_request_data(self, request_data):
         if not request_data["messages"]:
@@ -0,0 +1,57 @@
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from .utils import to_content_blocks
+from ...shared_utils.logger import setup_logger
+
+# Extra requests made for one answer that stopped at max_tokens, before giving up and returning it truncated
+MAX_CONTINUATIONS = int(os.getenv("MAX_CONTINUATIONS", 3))
+
+USAGE_KEYS = ("input_tokens", "output_tokens", "total_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+
+# send(request_data) -> (text, stop_reason, usage)
+SendRequest = Callable[[Dict[str, Any]], Awaitable[Tuple[str, Optional[str], Dict[str, int]]]]
+
+
+def continuation_request(request_data: Dict[str, Any], text: str) -> Dict[str, Any]:
+    """
+    The request asking for the rest of `text`: the same request with `text` as a prefilled assistant
+    turn, so the model resumes where it stopped. The earlier messages are unchanged and keep their
+    prompt-cache breakpoints.
+    """
+    messages = list(request_data["messages"])
+    if messages and messages[-1]["role"] == "assistant":
+        # The request already had a prefill: the answer extends it
+        previous = messages.pop()["content"]
+        prefix = previous if isinstance(previous, str) else "".join(block.get("text", "") for block in to_content_blocks(previous))
+        text = prefix + text
+    # The API rejects a final assistant turn ending with whitespace
+    messages.append({"role": "assistant", "content": text.rstrip()})
+    return {**request_data, "messages": messages}
+
+
+def merge_usage(total: Optional[Dict[str, int]], usage: Optional[Dict[str, int]]) -> Dict[str, int]:
+    total, usage = total or {}, usage or {}
+    return {key: total.get(key, 0) + usage.get(key, 0) for key in USAGE_KEYS}
+
+
+async def send_with_continuations(request_data: Dict[str, Any], send: SendRequest, telemetry=None,
+                                  max_continuations: int = MAX_CONTINUATIONS) -> Tuple[str, Dict[str, int]]:
+    """
+    Send the request and, while the answer stops at max_tokens, ask for the rest (up to
+    max_continuations times). Returns the stitched text and the usage summed over every request.
+    """
+    logger = setup_logger("Continuation")
+    text, stop_reason, usage = await send(request_data)
+    continuations = 0
+    while stop_reason == "max_tokens" and continuations < max_continuations:
+        continuations += 1
+        logger.info(f"Response stopped at max_tokens after {len(text)} characters, requesting continuation {continuations}/{max_continuations}")
+        more, stop_reason, more_usage = await send(continuation_request(request_data, text))
+        text += more
+        usage = merge_usage(usage, more_usage)
+    if stop_reason == "max_tokens":
+        logger.warning(f"Response still stopped at max_tokens after {continuations} continuation(s), it is truncated")
+    if telemetry:
+        telemetry.continuations = continuations
+        telemetry.truncated = stop_reason == "max_tokens"
+    return text, usage
@@ -1,3 +1,11 @@
 class OverloadedError(Exception):
     """Exception raised when the LLM provider is overloaded."""
-    pass
\ No newline at end of file
+    pass
+
+class ResponseCacheMissError(Exception):
+    """Exception raised when a request is not in the response cache while it is in read-only mode."""
+    pass
+
+class StubResponseNotFoundError(Exception):
+    """Exception raised when the stub provider has no scripted or recorded response for a request."""
+    pass
@@ -1,10 +1,29 @@
+import os
+import inspect
 from .claude_provider import ClaudeProvider
 from .haiku_provider import HaikuProvider
+from .stub_provider import StubProvider
 
-def get_provider(provider_name: str, run_dir: str):
-    if provider_name.lower() == "claude":
-        return ClaudeProvider(run_dir=run_dir)
-    elif provider_name.lower() == "haiku":
-        return HaikuProvider(run_dir=run_dir)
-    else:
-        raise ValueError(f"Unknown provider: {provider_name}")
\ No newline at end of file
+PROVIDERS = {
+    "claude": ClaudeProvider,
+    "haiku": HaikuProvider,
+    "stub": StubProvider,
+}
+
+def register_provider(provider_name: str, provider_class):
+    PROVIDERS[provider_name.lower()] = provider_class
+
+def get_provider(provider_name: str, run_dir: str = None):
+    # MY_ENGINEER_PROVIDER replaces every provider, e.g. with the offline stub for benchmarks.
+    # The replacement is told which provider it stands in for when it takes a `role`.
+    override = os.getenv("MY_ENGINEER_PROVIDER")
+    if override and override.lower() != provider_name.lower():
+        if override.lower() not in PROVIDERS:
+            raise ValueError(f"Unknown provider in MY_ENGINEER_PROVIDER: {override}")
+        provider_class = PROVIDERS[override.lower()]
+        if "role" in inspect.signature(provider_class.__init__).parameters:
+            return provider_class(run_dir=run_dir, role=provider_name.lower())
+        return provider_class(run_dir=run_dir)
+    if provider_name.lower() not in PROVIDERS:
+        raise ValueError(f"Unknown provider: {provider_name}")
+    return PROVIDERS[provider_name.lower()](run_dir=run_dir)
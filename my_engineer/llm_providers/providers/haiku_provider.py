@@ -1,54 +1,87 @@
 import os
-import json
-from datetime import datetime
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 from .base_provider import LLMProvider
-from .utils import prepare_messages, get_max_tokens
+from .utils import prepare_messages, get_max_tokens, get_min_cache_tokens, cacheable_text, log_usage, estimate_request_tokens
+from .scheduler import get_scheduler
+from .response_cache import get_response_cache
+from .cache_planner import CacheBreakpointPlanner
+from .telemetry import CallTelemetry
+from .hedging import get_hedger
+from .continuation import send_with_continuations
+from .request_log_store import get_request_log_store, REQUEST_LOG_FILE
 from rich.console import Console
 from my_engineer.shared_utils.logger import setup_logger
 
 class HaikuProvider(LLMProvider):
     def __init__(self, run_dir=None):
-        self.client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        self.client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), max_retries=0)
         self.model = "claude-3-haiku-20240307"
         self.max_tokens = get_max_tokens(self.model)
         self.logger = setup_logger("HaikuProvider")
         self.run_dir = run_dir
         self.console = Console()
+        self.cache_planner = CacheBreakpointPlanner(min_prefix_tokens=get_min_cache_tokens(self.model))
+        self.last_usage = None
 
-    def generate_response(self, messages, system_prompt=None):
+    async def generate_response_async(self, messages, system_prompt=None, on_text=None):
         prepared_messages = prepare_messages(messages)
         if not prepared_messages:
             raise ValueError("No valid messages provided")
 
         request_data = {
             "model": self.model,
+            "extra_headers": {
+                "anthropic-beta": "prompt-caching-2024-07-31",
+            },
             "max_tokens": self.max_tokens,
             "messages": prepared_messages,
         }
         if system_prompt:
-            request_data["system"] = system_prompt
+            request_data["system"] = [cacheable_text(system_prompt)]
+        request_data = self.cache_planner.enforce_limits(request_data)
 
         # Log the request
         self._log_request(request_data)
 
+        telemetry = CallTelemetry("haiku", self.model)
         try:
-            response = self.client.messages.create(**request_data)
-            response_data = response.model_dump()
-            if not response.content:
+            self.last_usage = None
+            cached = get_response_cache().get(request_data)
+            if cached is not None:
+                if on_text:
+                    on_text(cached["text"])
+                telemetry.finish(self.run_dir, cached_response=True)
+                return cached["text"]
+            text, self.last_usage = await send_with_continuations(
+                request_data, lambda data: self._send_once(data, telemetry), telemetry)
+            if not text:
                 raise ValueError("Received an empty response from Haiku")
             self.console.print("[bold green]Response received from Haiku.[/bold green]")
-            return response.content[0].text
+            get_response_cache().put(request_data, text, self.last_usage)
+            telemetry.finish(self.run_dir, usage=self.last_usage)
+            if on_text:
+                on_text(text)
+            return text
         except Exception as e:
+            telemetry.finish(self.run_dir, error=e)
             self.console.print("[bold red]Error while communicating with Haiku.[/bold red]")
             raise
 
+    async def _send_once(self, request_data, telemetry):
+        response = await get_hedger().run(
+            self.model,
+            lambda _: get_scheduler().submit(
+                self.model,
+                lambda: self.client.messages.create(**request_data),
+                estimated_tokens=estimate_request_tokens(request_data),
+                ticket=telemetry.ticket,
+            ),
+            telemetry=telemetry,
+        )
+        text = "".join(block.text for block in response.content if block.type == "text")
+        return text, response.stop_reason, log_usage(response.usage)
+
     def _log_request(self, request_data):
         if self.run_dir:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            log_filename = f"haiku_request_{timestamp}.json"
-            log_filepath = os.path.join(self.run_dir, log_filename)
-            with open(log_filepath, 'w') as log_file:
-                json.dump(request_data, log_file, indent=2)
-            self.logger.info(f"Complete Haiku request logged to: {log_filepath}")
-            self.console.print(f"[bold blue]Complete Haiku request logged to: {log_filepath}[/bold blue]")
\ No newline at end of file
+            record_id = get_request_log_store().log(self.run_dir, "haiku", request_data)
+            self.logger.info(f"Haiku request {record_id} logged to: {os.path.join(self.run_dir, REQUEST_LOG_FILE)}")
\ No newline at end of file
@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+from .utils import percentile
+from ...shared_utils.logger import setup_logger
+
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 95))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", 1.0))
+# Spend caps: at most this fraction of calls, and this many calls per run, get a duplicate request
+HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", 0.1))
+HEDGE_MAX_PER_RUN = int(os.getenv("LLM_HEDGE_MAX_PER_RUN", 20))
+HISTORY_SIZE = 200
+HISTORY_FILE = os.getenv("LLM_HEDGE_HISTORY_FILE", os.path.join("runs", "llm_latency_history.json"))
+
+
+class LatencyHistory:
+    """Recent time-to-first-token (streamed calls) and total latency (other calls) per model, persisted across runs."""
+
+    def __init__(self, history_file: str = HISTORY_FILE):
+        self.history_file = history_file
+        self.logger = setup_logger("LatencyHistory")
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+        if os.path.exists(history_file):
+            try:
+                with open(history_file, 'r') as f:
+                    for key, values in json.load(f).items():
+                        self._samples[key] = deque(values, maxlen=HISTORY_SIZE)
+            except (OSError, json.JSONDecodeError) as e:
+                self.logger.warning(f"Could not read latency history from {history_file}: {str(e)}")
+
+    @staticmethod
+    def _key(model: str, streaming: bool) -> str:
+        return f"{model}:{'first_token' if streaming else 'total'}"
+
+    def record(self, model: str, streaming: bool, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(self._key(model, streaming), deque(maxlen=HISTORY_SIZE)).append(round(seconds, 3))
+            try:
+                os.makedirs(os.path.dirname(self.history_file) or ".", exist_ok=True)
+                tmp_path = f"{self.history_file}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump({key: list(values) for key, values in self._samples.items()}, f)
+                os.replace(tmp_path, self.history_file)
+            except OSError as e:
+                self.logger.warning(f"Could not save latency history: {str(e)}")
+
+    def percentile(self, model: str, streaming: bool, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = list(self._samples.get(self._key(model, streaming), []))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return percentile(samples, pct)
+
+
+class RequestHedger:
+    """
+    Opt-in (LLM_HEDGING=1) hedging of slow calls: when a call has not produced its first token
+    (or, if not streamed, its answer) within the LLM_HEDGE_PERCENTILE of that model's recent
+    latency, a duplicate request is sent. Whichever produces its first token first (or answers
+    first) wins, and the other one is cancelled. Only the winner's text reaches the caller.
+    """
+
+    def __init__(self, enabled: Optional[bool] = None, history: Optional[LatencyHistory] = None):
+        self.enabled = enabled if enabled is not None else os.getenv("LLM_HEDGING", "0").lower() in ("1", "true", "on")
+        self._history = history
+        self._lock = threading.Lock()
+        self.logger = setup_logger("RequestHedger")
+        self.calls = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+
+    @property
+    def history(self) -> LatencyHistory:
+        if self._history is None:
+            self._history = LatencyHistory()
+        return self._history
+
+    def _allow_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges_fired >= HEDGE_MAX_PER_RUN or self.hedges_fired + 1 > self.calls * HEDGE_MAX_RATIO:
+                return False
+            self.hedges_fired += 1
+            return True
+
+    async def run(self, model: str, call: Callable[[Optional[Callable[[str], None]]], Awaitable],
+                  on_text: Optional[Callable[[str], None]] = None, telemetry=None):
+        """
+        Run `call`, hedging it when it is slow. `call` receives the text callback of its attempt
+        (None when not streaming) and must start a new request each time it is invoked.
+        """
+        streaming = on_text is not None
+        with self._lock:
+            self.calls += 1
+        threshold = self.history.percentile(model, streaming, HEDGE_PERCENTILE) if self.enabled else None
+        if threshold is None:
+            start = time.monotonic()
+            first_token = []
+
+            def record_first_token(text):
+                if not first_token:
+                    first_token.append(time.monotonic() - start)
+                on_text(text)
+
+            response = await call(record_first_token if streaming else None)
+            if self.enabled:
+                self.history.record(model, streaming, first_token[0] if first_token else time.monotonic() - start)
+            return response
+        return await self._run_hedged(model, call, on_text, telemetry, max(threshold, HEDGE_MIN_DELAY_SECONDS))
+
+    async def _run_hedged(self, model, call, on_text, telemetry, threshold):
+        streaming = on_text is not None
+        winner = None
+        starts = []
+        first_token = asyncio.Event()
+
+        def attempt_on_text(index):
+            def _on_text(text):
+                nonlocal winner
+                if winner is None:
+                    winner = index
+                    self.history.record(model, True, time.monotonic() - starts[index])
+                    first_token.set()
+                if winner == index:
+                    on_text(text)
+            return _on_text
+
+        def start_attempt():
+            index = len(starts)
+            starts.append(time.monotonic())
+            return asyncio.ensure_future(call(attempt_on_text(index) if streaming else None))
+
+        tasks = [start_attempt()]
+        token_waiter = asyncio.ensure_future(first_token.wait())
+        try:
+            await asyncio.wait([tasks[0], token_waiter], timeout=threshold, return_when=asyncio.FIRST_COMPLETED)
+            if not tasks[0].done() and not first_token.is_set() and self._allow_hedge():
+                self.logger.info(f"{model} call slower than {threshold:.1f}s, sending a hedged request")
+                if telemetry:
+                    telemetry.hedged = True
+                tasks.append(start_attempt())
+
+            pending = set(tasks)
+            while True:
+                if first_token.is_set():
+                    break
+                done, pending = await asyncio.wait(pending | {token_waiter}, return_when=asyncio.FIRST_COMPLETED)
+                done.discard(token_waiter)
+                pending.discard(token_waiter)
+                succeeded = [task for task in done if not task.exception()]
+                if succeeded:
+                    winner = tasks.index(succeeded[0]) if winner is None else winner
+                    break
+                if not pending:
+                    # Every attempt failed: surface the primary's error
+                    return await tasks[0]
+        finally:
+            token_waiter.cancel()
+            for index, task in enumerate(tasks):
+                if index == winner:
+                    continue
+                if task.done() and not task.cancelled():
+                    task.exception()  # Retrieved so a failed loser is not reported as unhandled
+                else:
+                    task.cancel()
+
+        if not streaming:
+            self.history.record(model, False, time.monotonic() - starts[winner])
+        if len(tasks) > 1 and winner == 1:
+            with self._lock:
+                self.hedges_won += 1
+            if telemetry:
+                telemetry.hedge_won = True
+        return await tasks[winner]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": self.calls, "hedges_fired": self.hedges_fired, "hedges_won": self.hedges_won}
+
+
+# Global hedger instance
+hedger = RequestHedger()
+
+def get_hedger() -> RequestHedger:
+    return hedger
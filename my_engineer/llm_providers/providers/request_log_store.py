@@ -0,0 +1,121 @@
+import os
+import gzip
+import json
+import uuid
+import atexit
+import hashlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+from ...shared_utils.logger import setup_logger
+
+REQUEST_LOG_FILE = "llm_requests.jsonl"
+DEFAULT_BLOB_MIN_BYTES = 2048
+
+
+class RequestLogStore:
+    """
+    Logs every LLM request as a small record in the run directory's llm_requests.jsonl.
+
+    Text blocks larger than LLM_LOG_BLOB_MIN_BYTES are stored once, gzip-compressed and named by
+    their SHA-256, in a blob directory shared by all runs (LLM_LOG_BLOB_DIR, default runs/request_blobs),
+    and the record references them by hash. The project context repeated on every turn is thus
+    written only once. Writes happen on a background thread so they never delay the API call.
+    """
+
+    def __init__(self, blob_dir: Optional[str] = None, blob_min_bytes: Optional[int] = None):
+        self.blob_dir = blob_dir or os.getenv("LLM_LOG_BLOB_DIR", os.path.join("runs", "request_blobs"))
+        self.blob_min_bytes = blob_min_bytes if blob_min_bytes is not None else int(os.getenv("LLM_LOG_BLOB_MIN_BYTES", DEFAULT_BLOB_MIN_BYTES))
+        self.logger = setup_logger("RequestLogStore")
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-request-log")
+        atexit.register(self.close)
+
+    def log(self, run_dir: Optional[str], provider: str, request_data: Dict[str, Any]) -> Optional[str]:
+        """Queue the request for logging and return the id of its record."""
+        if not run_dir:
+            return None
+        record_id = uuid.uuid4().hex
+        timestamp = datetime.now().isoformat()
+        self._executor.submit(self._write, run_dir, provider, request_data, record_id, timestamp)
+        return record_id
+
+    def flush(self) -> None:
+        """Block until every queued record has been written."""
+        self._executor.submit(lambda: None).result()
+
+    def close(self) -> None:
+        """Write the remaining records and stop the background writer."""
+        self._executor.shutdown(wait=True)
+
+    def _write(self, run_dir, provider, request_data, record_id, timestamp):
+        try:
+            record = {"id": record_id, "timestamp": timestamp, "provider": provider}
+            for key, value in request_data.items():
+                if key == "system":
+                    record[key] = self._externalize(value)
+                elif key == "messages":
+                    record[key] = [{**message, "content": self._externalize(message["content"])} for message in value]
+                else:
+                    record[key] = value
+            with open(os.path.join(run_dir, REQUEST_LOG_FILE), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            self.logger.error(f"Failed to log LLM request {record_id}: {str(e)}")
+
+    def _externalize(self, content):
+        if isinstance(content, str):
+            return self._externalize_text(content)
+        if isinstance(content, list):
+            blocks = []
+            for block in content:
+                if block.get("type") == "text" and "text" in block:
+                    block = {**block, "text": self._externalize_text(block["text"])}
+                blocks.append(block)
+            return blocks
+        return content
+
+    def _externalize_text(self, text: str):
+        data = text.encode("utf-8")
+        if len(data) < self.blob_min_bytes:
+            return text
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with gzip.open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return {"blob": digest, "bytes": len(data)}
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], f"{digest}.gz")
+
+    def read_blob(self, digest: str) -> str:
+        with gzip.open(self._blob_path(digest), 'rb') as f:
+            return f.read().decode("utf-8")
+
+    def load_request(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Rebuild the full request of a logged record by inlining its blobs."""
+        def inline(content):
+            if isinstance(content, dict) and "blob" in content:
+                return self.read_blob(content["blob"])
+            if isinstance(content, list):
+                return [{**block, "text": inline(block["text"])} if "text" in block else block for block in content]
+            return content
+
+        request = {key: value for key, value in record.items() if key not in ("id", "timestamp", "provider")}
+        if "system" in request:
+            request["system"] = inline(request["system"])
+        if "messages" in request:
+            request["messages"] = [{**message, "content": inline(message["content"])} for message in request["messages"]]
+        return request
+
+
+_request_log_store = None
+
+def get_request_log_store() -> RequestLogStore:
+    global _request_log_store
+    if _request_log_store is None:
+        _request_log_store = RequestLogStore()
+    return _request_log_store
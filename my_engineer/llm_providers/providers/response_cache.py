@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+from rich.console import Console
+from .exceptions import ResponseCacheMissError
+from ...shared_utils.logger import setup_logger
+
+CACHE_MODES = ("off", "readwrite", "readonly")
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_MB = 200
+
+
+def _canonical_content(content):
+    if isinstance(content, str):
+        return [{"type": "text", "text": content}]
+    if isinstance(content, list):
+        return [{k: v for k, v in block.items() if k != "cache_control"} for block in content]
+    return content
+
+
+def request_key(request_data: Dict[str, Any]) -> str:
+    """
+    Hash of everything that determines the answer: model, system prompt, messages and max tokens.
+    Prompt-cache markers and headers are left out since they do not change the response.
+    """
+    canonical = {
+        "model": request_data.get("model"),
+        "max_tokens": request_data.get("max_tokens"),
+        "system": _canonical_content(request_data.get("system")),
+        "messages": [
+            {"role": message["role"], "content": _canonical_content(message["content"])}
+            for message in request_data.get("messages", [])
+        ],
+    }
+    if request_data.get("tools"):
+        canonical["tools"] = request_data["tools"]
+    payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Opt-in disk cache of LLM responses, selected with LLM_CACHE:
+    - off: disabled (default)
+    - readwrite: serve hits and store new responses
+    - readonly: serve hits only and fail on a miss, for deterministic replays
+    Entries expire after LLM_CACHE_TTL_SECONDS and the least recently used ones are evicted
+    once the cache grows over LLM_CACHE_MAX_MB.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, mode: Optional[str] = None,
+                 ttl_seconds: Optional[float] = None, max_mb: Optional[float] = None):
+        self.mode = (mode or os.getenv("LLM_CACHE", "off")).lower()
+        if self.mode not in CACHE_MODES:
+            raise ValueError(f"Invalid LLM_CACHE mode: {self.mode}. Expected one of {', '.join(CACHE_MODES)}")
+        self.cache_dir = cache_dir or os.getenv("LLM_CACHE_DIR", os.path.join("runs", "llm_cache"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("LLM_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+        self.max_bytes = int((max_mb if max_mb is not None else float(os.getenv("LLM_CACHE_MAX_MB", DEFAULT_MAX_MB))) * 1024 * 1024)
+        self._lock = threading.Lock()
+        self.logger = setup_logger("ResponseCache")
+        self.console = Console()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, request_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        key = request_key(request_data)
+        path = self._entry_path(key)
+        entry = None
+        with self._lock:
+            if os.path.exists(path):
+                if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                    os.remove(path)
+                else:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        entry = json.load(f)
+                    os.utime(path)  # Mark as recently used
+        if entry is None:
+            if self.mode == "readonly":
+                raise ResponseCacheMissError(f"No cached response for {request_data.get('model')} request {key[:12]}")
+            return None
+        self.logger.info(f"LLM cache hit for {request_data.get('model')}: {key[:12]}")
+        self.console.print(f"[bold magenta]LLM cache hit ({request_data.get('model')}, {key[:12]}), skipping API call.[/bold magenta]")
+        return entry
+
+    def put(self, request_data: Dict[str, Any], text: str, usage: Optional[Dict[str, int]] = None) -> None:
+        if self.mode != "readwrite":
+            return
+        key = request_key(request_data)
+        path = self._entry_path(key)
+        entry = {"key": key, "model": request_data.get("model"), "created_at": time.time(), "text": text, "usage": usage or {}}
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+            self._evict()
+        self.logger.debug(f"Stored LLM response in cache: {key[:12]}")
+
+    def _evict(self) -> None:
+        entries = []
+        total_bytes = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total_bytes += stat.st_size
+        now = time.time()
+        for mtime, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes and now - mtime <= self.ttl_seconds:
+                continue
+            os.remove(path)
+            total_bytes -= size
+            self.logger.debug(f"Evicted LLM cache entry: {os.path.basename(path)}")
+
+
+_response_cache = None
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
@@ -0,0 +1,214 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import anthropic
+from .exceptions import OverloadedError
+from ...shared_utils.logger import setup_logger
+
+# Client-side budgets are opt-in: LLM_RATE_LIMITS=1 paces calls to the tier-1 limits below, and
+# LLM_REQUESTS_PER_MINUTE / LLM_TOKENS_PER_MINUTE set your own. Otherwise only 429/529 responses slow calls down.
+LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS", "0").lower() in ("1", "true", "on")
+MODEL_RATE_LIMITS = {
+    "claude-3-haiku-20240307": {"requests_per_minute": 50, "tokens_per_minute": 50000},
+    "claude-3-5-sonnet-20240620": {"requests_per_minute": 50, "tokens_per_minute": 40000},
+}
+DEFAULT_RATE_LIMITS = {"requests_per_minute": 50, "tokens_per_minute": 40000}
+
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 5))
+BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", 1.0))
+BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", 60.0))
+WINDOW_SECONDS = 60.0
+OVERLOADED_STATUS = 529
+
+
+class CallTicket:
+    """Filled in by the scheduler for a single call: how long it queued and how often it was retried."""
+
+    def __init__(self):
+        self.queue_wait_seconds = 0.0
+        self.retries = 0
+
+
+class ModelBudget:
+    """Sliding one-minute window of the requests and input tokens sent to one model. A None limit is not enforced."""
+
+    def __init__(self, requests_per_minute: Optional[int], tokens_per_minute: Optional[int]):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = deque()  # (timestamp, tokens)
+        self.window_tokens = 0
+        self.blocked_until = 0.0
+        self.queue_depth = 0
+        self.requests = 0
+        self.retries = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def try_acquire(self, tokens: int, now: float) -> float:
+        """Reserve budget for a request. Returns 0 when admitted, otherwise how long to wait before trying again."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.requests_per_minute is None and self.tokens_per_minute is None:
+            return 0.0
+        while self.window and self.window[0][0] <= now - WINDOW_SECONDS:
+            self.window_tokens -= self.window.popleft()[1]
+        fits_requests = self.requests_per_minute is None or len(self.window) < self.requests_per_minute
+        # A single request larger than the whole token budget is still let through once the window is empty
+        fits_tokens = (self.tokens_per_minute is None or self.window_tokens + tokens <= self.tokens_per_minute
+                       or not self.window)
+        if fits_requests and fits_tokens:
+            self.window.append((now, tokens))
+            self.window_tokens += tokens
+            return 0.0
+        return max(self.window[0][0] + WINDOW_SECONDS - now, 0.05)
+
+
+class RequestScheduler:
+    """
+    Shared gate for every LLM call: retries transient failures with jittered exponential backoff,
+    holds every caller of a model back after a 429, and, when enabled, enforces per-model request
+    and token budgets across concurrent callers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._budgets: Dict[str, ModelBudget] = {}
+        self.logger = setup_logger("RequestScheduler")
+
+    def set_limits(self, model: str, requests_per_minute: Optional[int], tokens_per_minute: Optional[int],
+                   keep_existing: bool = False) -> None:
+        """Budget for `model`; None leaves a limit unenforced. keep_existing leaves a budget already in use alone."""
+        with self._lock:
+            if keep_existing and model in self._budgets:
+                return
+            self._budgets[model] = ModelBudget(requests_per_minute, tokens_per_minute)
+
+    @staticmethod
+    def _default_limits(model: str) -> Tuple[Optional[int], Optional[int]]:
+        requests_per_minute = os.getenv("LLM_REQUESTS_PER_MINUTE")
+        tokens_per_minute = os.getenv("LLM_TOKENS_PER_MINUTE")
+        limits = {**DEFAULT_RATE_LIMITS, **MODEL_RATE_LIMITS.get(model, {})} if LLM_RATE_LIMITS else {}
+        return (
+            int(requests_per_minute) if requests_per_minute else limits.get("requests_per_minute"),
+            int(tokens_per_minute) if tokens_per_minute else limits.get("tokens_per_minute"),
+        )
+
+    def _budget(self, model: str) -> ModelBudget:
+        if model not in self._budgets:
+            self._budgets[model] = ModelBudget(*self._default_limits(model))
+        return self._budgets[model]
+
+    async def submit(self, model: str, call: Callable[[], Awaitable], estimated_tokens: int = 0,
+                     ticket: Optional[CallTicket] = None, can_retry: Optional[Callable[[], bool]] = None):
+        """
+        Run `call` once budget is available for `model`, retrying overloads, rate limits and transient errors.
+        `can_retry` lets callers veto a retry, e.g. once part of a streamed answer has been shown.
+        """
+        ticket = ticket or CallTicket()
+        attempt = 0
+        while True:
+            await self._acquire(model, estimated_tokens, ticket)
+            try:
+                return await call()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None or (can_retry and not can_retry()):
+                    raise
+                if attempt >= MAX_RETRIES:
+                    if self._is_capacity_error(e):
+                        raise OverloadedError(f"{model} still unavailable after {attempt} retries: {str(e)}") from e
+                    raise
+                attempt += 1
+                ticket.retries = attempt
+                self._record_retry(model, e, delay)
+                self.logger.warning(f"{model} call failed ({type(e).__name__}), retry {attempt}/{MAX_RETRIES} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _acquire(self, model: str, tokens: int, ticket: CallTicket) -> None:
+        started = time.monotonic()
+        queued = False
+        try:
+            while True:
+                with self._lock:
+                    budget = self._budget(model)
+                    wait = budget.try_acquire(tokens, time.monotonic())
+                    if wait == 0.0:
+                        budget.requests += 1
+                        break
+                    if not queued:
+                        queued = True
+                        budget.queue_depth += 1
+                    depth = budget.queue_depth
+                self.logger.info(f"Waiting {wait:.1f}s for {model} budget (queue depth {depth})")
+                await asyncio.sleep(wait)
+        finally:
+            waited = time.monotonic() - started
+            with self._lock:
+                budget = self._budget(model)
+                if queued:
+                    budget.queue_depth -= 1
+                budget.total_wait_seconds += waited
+                budget.max_wait_seconds = max(budget.max_wait_seconds, waited)
+            ticket.queue_wait_seconds += waited
+
+    def _record_retry(self, model: str, error: Exception, delay: float) -> None:
+        with self._lock:
+            budget = self._budget(model)
+            budget.retries += 1
+            if getattr(error, "status_code", None) == 429:
+                # Back off every caller of this model, not just the one that was throttled
+                budget.blocked_until = max(budget.blocked_until, time.monotonic() + delay)
+
+    @staticmethod
+    def _is_capacity_error(error: Exception) -> bool:
+        return isinstance(error, OverloadedError) or getattr(error, "status_code", None) in (429, OVERLOADED_STATUS)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        status_code = getattr(error, "status_code", None)
+        retryable = (
+            isinstance(error, (OverloadedError, anthropic.APIConnectionError))
+            or status_code in (408, 409, 429)
+            or (status_code is not None and status_code >= 500)
+        )
+        if not retryable:
+            return None
+        delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+        retry_after = self._retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        value = response.headers.get("retry-after")
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                model: {
+                    "queue_depth": budget.queue_depth,
+                    "requests": budget.requests,
+                    "retries": budget.retries,
+                    "avg_wait_seconds": round(budget.total_wait_seconds / budget.requests, 3) if budget.requests else 0.0,
+                    "max_wait_seconds": round(budget.max_wait_seconds, 3),
+                }
+                for model, budget in self._budgets.items()
+            }
+
+
+# Global scheduler instance
+scheduler = RequestScheduler()
+
+def get_scheduler() -> RequestScheduler:
+    return scheduler
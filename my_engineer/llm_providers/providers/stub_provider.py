@@ -0,0 +1,257 @@
+import os
+import re
+import json
+import random
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional
+import yaml
+import httpx
+import anthropic
+from .base_provider import LLMProvider
+from .utils import get_max_tokens, prepare_messages, estimate_request_tokens
+from .scheduler import get_scheduler
+from .response_cache import ResponseCache
+from .telemetry import CallTelemetry, current_stage
+from .hedging import get_hedger
+from .continuation import send_with_continuations
+from .exceptions import ResponseCacheMissError, StubResponseNotFoundError
+from ...shared_utils.logger import setup_logger
+
+# Models the stub impersonates, so recorded responses are looked up under the same cache keys
+ROLE_MODELS = {
+    "claude": os.getenv("CLAUDE_MODEL", "claude-3-5-sonnet-20240620"),
+    "haiku": "claude-3-haiku-20240307",
+}
+
+INJECTED_ERRORS = {
+    "overloaded": (529, "overloaded_error", "Overloaded"),
+    "rate_limit": (429, "rate_limit_error", "Number of requests has exceeded your rate limit"),
+}
+
+STREAM_CHUNK_CHARS = 64
+
+
+def make_api_error(kind: str, retry_after: Optional[float] = None) -> anthropic.APIStatusError:
+    """Build the error the SDK would raise for an overloaded (529) or rate-limited (429) response."""
+    if kind not in INJECTED_ERRORS:
+        raise ValueError(f"Unknown injected error: {kind}. Expected one of {', '.join(INJECTED_ERRORS)}")
+    status_code, error_type, message = INJECTED_ERRORS[kind]
+    headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+    body = {"type": "error", "error": {"type": error_type, "message": message}}
+    response = httpx.Response(status_code, headers=headers, json=body,
+                              request=httpx.Request("POST", "https://api.anthropic.com/v1/messages"))
+    if status_code == 429:
+        return anthropic.RateLimitError(message, response=response, body=body)
+    return anthropic.APIStatusError(message, response=response, body=body)
+
+
+def load_stub_script(path: str) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith(".json"):
+            return json.load(f)
+        return yaml.safe_load(f) or {}
+
+
+def _request_text(request_data: Dict[str, Any]) -> str:
+    parts = []
+    for content in [request_data.get("system")] + [message["content"] for message in request_data["messages"]]:
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(block.get("text") or (block.get("content") if isinstance(block.get("content"), str) else "") for block in content)
+    return "\n".join(parts)
+
+
+class StubProvider(LLMProvider):
+    """
+    Offline provider serving scripted or recorded responses, for benchmarks and tests.
+
+    Responses come from, in order:
+    - the first rule of the STUB_PROVIDER_SCRIPT file (JSON or YAML) that matches the request,
+    - the recorded LLM response cache (LLM_CACHE_DIR) when STUB_PROVIDER_REPLAY is set,
+    - the script's `default` response.
+
+    A script looks like:
+
+        default: "..."
+        latency_seconds: 0.5
+        rules:
+          - stage: patching          # optional, matches the llm_stage of the call
+            match: "def main"        # optional regex searched in the request text
+            response: "..."          # or response_file: path/to/response.txt
+            tool_calls:              # optional, answer of a tool-use request (generate_tool_response)
+              - {name: new_file, input: {file_path: a.py, content: "..."}}
+            stop_reason: max_tokens  # optional, e.g. to exercise continuations (the next request ends with the text as an assistant turn)
+            error: overloaded        # optional, overloaded or rate_limit, injected instead of answering
+            times: 1                 # optional, rule only applies to its first N matches
+            latency_seconds: 2.0
+            time_to_first_token_seconds: 0.3
+            usage: {input_tokens: 1200, output_tokens: 300}
+
+    Latency, time to first token and random error injection can also be set for every call with
+    STUB_PROVIDER_LATENCY_SECONDS, STUB_PROVIDER_TTFT_SECONDS, STUB_PROVIDER_ERROR_RATE,
+    STUB_PROVIDER_ERROR and STUB_PROVIDER_SEED. Calls go through the shared scheduler, so injected
+    errors are retried like real ones, under an unlimited budget of their own so rate limits never
+    slow an offline run down.
+    """
+
+    def __init__(self, run_dir=None, role: str = "claude", script_path: Optional[str] = None):
+        self.role = role
+        self.model = ROLE_MODELS.get(role, role)
+        # Offline calls are never paced like real ones, but still go through the scheduler's retries
+        self.budget_key = f"stub:{self.model}"
+        get_scheduler().set_limits(self.budget_key, None, None, keep_existing=True)
+        self.max_tokens = get_max_tokens(self.model)
+        self.run_dir = run_dir
+        self.logger = setup_logger("StubProvider")
+        self.last_usage = None
+        self.script_path = script_path or os.getenv("STUB_PROVIDER_SCRIPT")
+        script = load_stub_script(self.script_path) if self.script_path else {}
+        self.rules: List[Dict[str, Any]] = script.get("rules", [])
+        self.default_response: Optional[str] = script.get("default")
+        self.latency_seconds = float(script.get("latency_seconds", os.getenv("STUB_PROVIDER_LATENCY_SECONDS", 0)))
+        self.ttft_seconds = float(script.get("time_to_first_token_seconds", os.getenv("STUB_PROVIDER_TTFT_SECONDS", 0)))
+        self.error_rate = float(script.get("error_rate", os.getenv("STUB_PROVIDER_ERROR_RATE", 0)))
+        self.error_kind = script.get("error", os.getenv("STUB_PROVIDER_ERROR", "overloaded"))
+        self.replay_cache = ResponseCache(mode="readonly") if os.getenv("STUB_PROVIDER_REPLAY") else None
+        self._random = random.Random(int(os.getenv("STUB_PROVIDER_SEED", 0)))
+        self._rule_hits = [0] * len(self.rules)
+        self._tool_call_count = 0
+        self._lock = threading.Lock()
+
+    async def generate_response_async(self, messages, system_prompt=None, on_text=None):
+        prepared_messages = prepare_messages(messages)
+        if not prepared_messages:
+            raise ValueError("No valid messages provided")
+        request_data = {"model": self.model, "max_tokens": self.max_tokens, "messages": prepared_messages}
+        if system_prompt:
+            request_data["system"] = [{"type": "text", "text": system_prompt}]
+
+        telemetry = CallTelemetry("stub", self.model)
+        try:
+            self.last_usage = None
+            text, self.last_usage = await send_with_continuations(
+                request_data, lambda data: self._send_once(data, on_text, telemetry), telemetry)
+            telemetry.finish(self.run_dir, usage=self.last_usage)
+            return text
+        except Exception as e:
+            telemetry.finish(self.run_dir, error=e)
+            raise
+
+    async def _send_once(self, request_data, on_text, telemetry):
+        rule_holder = {}
+        response = await get_hedger().run(
+            self.model,
+            lambda attempt_on_text: get_scheduler().submit(
+                self.budget_key,
+                lambda: self._respond(request_data, attempt_on_text, telemetry, rule_holder),
+                estimated_tokens=estimate_request_tokens(request_data),
+                ticket=telemetry.ticket,
+            ),
+            on_text,
+            telemetry,
+        )
+        return response["text"], rule_holder.get("rule", {}).get("stop_reason", "end_turn"), response["usage"]
+
+    async def generate_tool_response_async(self, messages, tools, system_prompt=None):
+        prepared_messages = prepare_messages(messages)
+        if not prepared_messages:
+            raise ValueError("No valid messages provided")
+        request_data = {"model": self.model, "max_tokens": self.max_tokens, "messages": prepared_messages, "tools": tools}
+        if system_prompt:
+            request_data["system"] = [{"type": "text", "text": system_prompt}]
+
+        telemetry = CallTelemetry("stub", self.model)
+        try:
+            self.last_usage = None
+            rule_holder = {}
+            response = await get_scheduler().submit(
+                self.budget_key,
+                lambda: self._respond(request_data, None, telemetry, rule_holder),
+                estimated_tokens=estimate_request_tokens(request_data),
+                ticket=telemetry.ticket,
+            )
+            self.last_usage = response["usage"]
+            telemetry.finish(self.run_dir, usage=self.last_usage)
+            rule = rule_holder.get("rule", {})
+            content = [{"type": "text", "text": response["text"]}] if response["text"] else []
+            with self._lock:
+                for call in rule.get("tool_calls", []):
+                    self._tool_call_count += 1
+                    content.append({"type": "tool_use", "id": f"toolu_stub_{self._tool_call_count}", "name": call["name"], "input": call.get("input", {})})
+            return {"content": content, "stop_reason": rule.get("stop_reason", "tool_use" if rule.get("tool_calls") else "end_turn")}
+        except Exception as e:
+            telemetry.finish(self.run_dir, error=e)
+            raise
+
+    async def _respond(self, request_data, on_text, telemetry, rule_holder=None):
+        rule = self._match_rule(request_data)
+        if rule_holder is not None:
+            rule_holder["rule"] = rule
+        latency = float(rule.get("latency_seconds", self.latency_seconds))
+        ttft = min(float(rule.get("time_to_first_token_seconds", self.ttft_seconds)), latency) if latency else 0.0
+
+        error_kind = rule.get("error")
+        if not error_kind and self.error_rate:
+            with self._lock:
+                if self._random.random() < self.error_rate:
+                    error_kind = self.error_kind
+        if error_kind:
+            await asyncio.sleep(ttft)
+            raise make_api_error(error_kind, rule.get("retry_after"))
+
+        text = self._response_text(rule, request_data)
+        if on_text:
+            await asyncio.sleep(ttft)
+            chunks = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)] or [""]
+            for chunk in chunks:
+                telemetry.mark_first_token()
+                on_text(chunk)
+                await asyncio.sleep((latency - ttft) / len(chunks))
+        else:
+            await asyncio.sleep(latency)
+
+        usage = {
+            "input_tokens": estimate_request_tokens(request_data),
+            "output_tokens": len(text) // 4,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0,
+            **rule.get("usage", {}),
+        }
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        return {"text": text, "usage": usage}
+
+    def _match_rule(self, request_data) -> Dict[str, Any]:
+        stage = current_stage.get()
+        request_text = None
+        with self._lock:
+            for index, rule in enumerate(self.rules):
+                if rule.get("stage") and rule["stage"] != stage:
+                    continue
+                if "times" in rule and self._rule_hits[index] >= rule["times"]:
+                    continue
+                if rule.get("match"):
+                    request_text = request_text if request_text is not None else _request_text(request_data)
+                    if not re.search(rule["match"], request_text, re.DOTALL):
+                        continue
+                self._rule_hits[index] += 1
+                return rule
+        return {}
+
+    def _response_text(self, rule, request_data) -> str:
+        if "response" in rule:
+            return rule["response"]
+        if "tool_calls" in rule:
+            return ""
+        if "response_file" in rule:
+            with open(rule["response_file"], 'r', encoding='utf-8') as f:
+                return f.read()
+        if self.replay_cache:
+            try:
+                return self.replay_cache.get(request_data)["text"]
+            except ResponseCacheMissError:
+                pass
+        if self.default_response is not None:
+            return self.default_response
+        raise StubResponseNotFoundError(f"No stub response for {self.role} request in stage '{current_stage.get()}'")
@@ -0,0 +1,95 @@
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional
+from pydantic import BaseModel
+from .scheduler import CallTicket
+
+TELEMETRY_FILE = "llm_calls.jsonl"
+
+current_stage = contextvars.ContextVar("llm_stage", default="unknown")
+_write_lock = threading.Lock()
+
+
+@contextmanager
+def llm_stage(name: str):
+    """Attribute every LLM call made inside this block to a pipeline stage (summaries, selection, patching, ...)."""
+    token = current_stage.set(name)
+    try:
+        yield
+    finally:
+        current_stage.reset(token)
+
+
+class LLMCallRecord(BaseModel):
+    timestamp: str
+    stage: str
+    provider: str
+    model: str
+    latency_seconds: float
+    time_to_first_token_seconds: Optional[float] = None
+    queue_wait_seconds: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+    retries: int = 0
+    cached_response: bool = False
+    hedged: bool = False
+    hedge_won: bool = False
+    continuations: int = 0
+    truncated: bool = False
+    error: Optional[str] = None
+
+
+class CallTelemetry:
+    """Measures one provider call and appends its record to llm_calls.jsonl in the run directory."""
+
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        self.stage = current_stage.get()
+        self.ticket = CallTicket()
+        self._started_at = datetime.now()
+        self._start = time.monotonic()
+        self._first_token_at = None
+        self.hedged = False
+        self.hedge_won = False
+        self.continuations = 0
+        self.truncated = False
+
+    def mark_first_token(self) -> None:
+        if self._first_token_at is None:
+            self._first_token_at = time.monotonic()
+
+    def finish(self, run_dir: Optional[str], usage: Optional[Dict[str, int]] = None,
+               cached_response: bool = False, error: Optional[Exception] = None) -> LLMCallRecord:
+        usage = usage or {}
+        record = LLMCallRecord(
+            timestamp=self._started_at.isoformat(),
+            stage=self.stage,
+            provider=self.provider,
+            model=self.model,
+            latency_seconds=round(time.monotonic() - self._start, 3),
+            time_to_first_token_seconds=round(self._first_token_at - self._start, 3) if self._first_token_at else None,
+            queue_wait_seconds=round(self.ticket.queue_wait_seconds, 3),
+            input_tokens=usage.get("input_tokens", 0),
+            output_tokens=usage.get("output_tokens", 0),
+            cache_creation_input_tokens=usage.get("cache_creation_input_tokens", 0),
+            cache_read_input_tokens=usage.get("cache_read_input_tokens", 0),
+            retries=self.ticket.retries,
+            cached_response=cached_response,
+            hedged=self.hedged,
+            hedge_won=self.hedge_won,
+            continuations=self.continuations,
+            truncated=self.truncated,
+            error=f"{type(error).__name__}: {str(error)}" if error else None,
+        )
+        if run_dir:
+            with _write_lock:
+                with open(os.path.join(run_dir, TELEMETRY_FILE), 'a', encoding='utf-8') as f:
+                    f.write(record.model_dump_json() + "\n")
+        return record
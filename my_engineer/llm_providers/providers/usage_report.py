@@ -0,0 +1,96 @@
+import os
+import json
+from typing import Any, Dict, List
+from rich.console import Console
+from rich.table import Table
+from .telemetry import TELEMETRY_FILE
+from .utils import estimate_cost, percentile
+
+
+def load_call_records(runs_dir: str) -> List[Dict[str, Any]]:
+    records = []
+    if not os.path.isdir(runs_dir):
+        return records
+    for root, _, files in os.walk(runs_dir):
+        if TELEMETRY_FILE not in files:
+            continue
+        with open(os.path.join(root, TELEMETRY_FILE), 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return records
+
+
+def aggregate_usage(runs_dir: str = "runs") -> Dict[str, Dict[str, Any]]:
+    """Per-stage totals (calls, tokens, cost) and latency percentiles across every run under `runs_dir`."""
+    stages: Dict[str, Dict[str, Any]] = {}
+    for record in load_call_records(runs_dir):
+        stage = stages.setdefault(record.get("stage", "unknown"), {
+            "calls": 0, "errors": 0, "cached_responses": 0, "retries": 0, "hedged": 0, "hedges_won": 0,
+            "continuations": 0, "truncated": 0,
+            "input_tokens": 0, "output_tokens": 0, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0,
+            "cost_usd": 0.0, "latencies": [], "ttfts": [],
+        })
+        stage["calls"] += 1
+        stage["errors"] += 1 if record.get("error") else 0
+        stage["cached_responses"] += 1 if record.get("cached_response") else 0
+        stage["retries"] += record.get("retries", 0)
+        stage["hedged"] += 1 if record.get("hedged") else 0
+        stage["hedges_won"] += 1 if record.get("hedge_won") else 0
+        stage["continuations"] += record.get("continuations", 0)
+        stage["truncated"] += 1 if record.get("truncated") else 0
+        for key in ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"):
+            stage[key] += record.get(key, 0)
+        stage["cost_usd"] += estimate_cost(record.get("model"), record)
+        if not record.get("cached_response") and not record.get("error"):
+            stage["latencies"].append(record.get("latency_seconds", 0.0))
+            if record.get("time_to_first_token_seconds") is not None:
+                stage["ttfts"].append(record["time_to_first_token_seconds"])
+
+    for stage in stages.values():
+        latencies = stage.pop("latencies")
+        ttfts = stage.pop("ttfts")
+        for pct in (50, 90, 99):
+            stage[f"latency_p{pct}"] = percentile(latencies, pct)
+            stage[f"ttft_p{pct}"] = percentile(ttfts, pct)
+        stage["cost_usd"] = round(stage["cost_usd"], 4)
+    return stages
+
+
+def print_usage_report(runs_dir: str = "runs") -> Dict[str, Dict[str, Any]]:
+    console = Console()
+    stages = aggregate_usage(runs_dir)
+    if not stages:
+        console.print(f"[yellow]No LLM call records found under {runs_dir}.[/yellow]")
+        return stages
+
+    table = Table(title=f"LLM usage by stage ({runs_dir})")
+    for column in ("Stage", "Calls", "Errors", "Cached", "Retries", "Hedged (won)", "Continued (truncated)", "Input", "Output", "Cache write", "Cache read",
+                   "Cost ($)", "Latency p50/p90/p99 (s)", "TTFT p50/p90/p99 (s)"):
+        table.add_column(column, justify="left" if column == "Stage" else "right")
+
+    for name, stage in sorted(stages.items(), key=lambda item: -item[1]["cost_usd"]):
+        table.add_row(
+            name,
+            str(stage["calls"]),
+            str(stage["errors"]),
+            str(stage["cached_responses"]),
+            str(stage["retries"]),
+            f"{stage['hedged']} ({stage['hedges_won']})",
+            f"{stage['continuations']} ({stage['truncated']})",
+            f"{stage['input_tokens']:,}",
+            f"{stage['output_tokens']:,}",
+            f"{stage['cache_creation_input_tokens']:,}",
+            f"{stage['cache_read_input_tokens']:,}",
+            f"{stage['cost_usd']:.4f}",
+            f"{stage['latency_p50']:.2f} / {stage['latency_p90']:.2f} / {stage['latency_p99']:.2f}",
+            f"{stage['ttft_p50']:.2f} / {stage['ttft_p90']:.2f} / {stage['ttft_p99']:.2f}",
+        )
+    console.print(table)
+    console.print(f"[bold]Total cost: ${sum(stage['cost_usd'] for stage in stages.values()):.4f}[/bold]")
+    return stages
@@ -2,6 +2,7 @@ import json
 from typing import Dict
 import os
 from rich.console import Console
+from ...shared_utils.logger import setup_logger
 
 MODEL_MAX_TOKENS = {
     "claude-3-haiku-20240307": 4096,
@@ -11,25 +12,85 @@ MODEL_MAX_TOKENS = {
 def get_max_tokens(model):
     return MODEL_MAX_TOKENS.get(model, 4096)
 
+# Shortest prefix the API will cache, per model
+MODEL_MIN_CACHE_TOKENS = {
+    "claude-3-haiku-20240307": 2048,
+    "claude-3-5-sonnet-20240620": 1024
+}
+
+def get_min_cache_tokens(model):
+    return MODEL_MIN_CACHE_TOKENS.get(model, 1024)
+
+# USD per million tokens
+MODEL_PRICING = {
+    "claude-3-haiku-20240307": {"input": 0.25, "output": 1.25, "cache_write": 0.30, "cache_read": 0.03},
+    "claude-3-5-sonnet-20240620": {"input": 3.00, "output": 15.00, "cache_write": 3.75, "cache_read": 0.30}
+}
+
+def estimate_cost(model, usage):
+    pricing = MODEL_PRICING.get(model)
+    if not pricing or not usage:
+        return 0.0
+    return (
+        usage.get("input_tokens", 0) * pricing["input"]
+        + usage.get("output_tokens", 0) * pricing["output"]
+        + usage.get("cache_creation_input_tokens", 0) * pricing["cache_write"]
+        + usage.get("cache_read_input_tokens", 0) * pricing["cache_read"]
+    ) / 1_000_000
+
+def percentile(values, pct):
+    """Nearest-rank percentile, 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))]
+
+def estimate_request_tokens(request_data):
+    """Rough input token estimate (4 characters per token) used for rate-limit budgeting."""
+    payload = json.dumps({"system": request_data.get("system"), "messages": request_data.get("messages")})
+    return len(payload) // 4
+
+def to_content_blocks(content):
+    if isinstance(content, str):
+        return [{"type": "text", "text": content}]
+    return [dict(block) for block in content]
+
+def cacheable_text(text):
+    """A text block marked as a prompt-cache breakpoint, for large blocks shared between requests."""
+    return {"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}
+
+def _has_content(content):
+    if isinstance(content, str):
+        return bool(content.strip())
+    return any(block.get("type") != "text" or block.get("text", "").strip() for block in content)
+
 def prepare_messages(messages):
     prepared_messages = []
     for message in messages:
-        if message["role"] in ["user", "assistant"] and message["content"].strip():
+        content = message["content"]
+        if message["role"] in ["user", "assistant"] and _has_content(content):
             if not prepared_messages or prepared_messages[-1]["role"] != message["role"]:
-                prepared_messages.append(message)
+                prepared_messages.append({"role": message["role"], "content": content})
+            elif isinstance(content, str) and isinstance(prepared_messages[-1]["content"], str):
+                prepared_messages[-1]["content"] += "\n" + content
             else:
-                prepared_messages[-1]["content"] += "\n" + message["content"]
+                # Keep structured blocks apart so their boundaries stay byte-stable for prompt caching
+                prepared_messages[-1]["content"] = to_content_blocks(prepared_messages[-1]["content"]) + to_content_blocks(content)
     return prepared_messages
 
-def log_usage(usage_info):
-    usage_data = {
-        "input_tokens": getattr(usage_info, 'input_tokens', 0),
-        "output_tokens": getattr(usage_info, 'output_tokens', 0),
-        "total_tokens": getattr(usage_info, 'input_tokens', 0) + getattr(usage_info, 'output_tokens', 0),
-        "cache_creation_input_tokens": getattr(usage_info, 'cache_creation_input_tokens', 0),
-        "cache_read_input_tokens": getattr(usage_info, 'cache_read_input_tokens', 0)
+def usage_to_dict(usage_info):
+    return {
+        "input_tokens": getattr(usage_info, 'input_tokens', 0) or 0,
+        "output_tokens": getattr(usage_info, 'output_tokens', 0) or 0,
+        "total_tokens": (getattr(usage_info, 'input_tokens', 0) or 0) + (getattr(usage_info, 'output_tokens', 0) or 0),
+        "cache_creation_input_tokens": getattr(usage_info, 'cache_creation_input_tokens', 0) or 0,
+        "cache_read_input_tokens": getattr(usage_info, 'cache_read_input_tokens', 0) or 0
     }
-    print(f"Claude Usage: {json.dumps(usage_data, indent=2)}")
+
+def log_usage(usage_info):
+    usage_data = usage_to_dict(usage_info)
+    setup_logger("llm_usage").debug(f"LLM usage: {json.dumps(usage_data)}")
+    return usage_data
 
 def log_llm_request(model: str):
     console = Console()
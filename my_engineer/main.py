@@ -8,7 +8,7 @@ from .llm_prompter.llm_prompter import LLMPrompter
 from .instruction_processor.instruction_processor import InstructionProcessor
 from .patch_processor.patch_processor import PatchProcessor
 from .file_operator.file_operator import FileOperator
-from .shared_utils.test_runner.test_runner import run_unit_tests
+from .shared_utils.test_runner.test_selector import run_selected_tests
 from .shared_utils.git_utils import check_uncommitted_changes, merge_current_branch_to_main, is_git_repo
 from .shared_utils.pipeline_helpers import (
     setup_run_directory, get_prompt_content, create_git_branch, generate_instructions,
@@ -20,11 +20,14 @@ from .shared_utils.auto_test_fixer import auto_fix_tests
 from .shared_utils.user_input import get_user_approval, InputType
 from .shared_utils.logger import setup_logger, get_log_file_path
 from .shared_utils.file_utils import empty_file
+from .shared_utils.workspace_transaction import open_turn_transaction, rollback_journal
+from .shared_utils.workspace_overlay import WorkspaceOverlay
 from .conversation_manager import ConversationManager
 from .conversation_manager.conversation_manager import PydanticEncoder
 from .shared_models.chat_models import ConversationState, Message
 from .prompt_post_processor import PromptPostProcessor
 from .llm_prompter.src.context_utils import get_context
+from .llm_providers import get_scheduler, get_hedger, print_usage_report
 import argparse
 from .shared_utils.config import get_config
 from rich.console import Console
@@ -42,6 +45,8 @@ project_root = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, project_root)
 
 LOG_LEVEL = os.environ.get('LOGLEVEL', 'DEBUG').upper()
+# Stage each turn in memory and only write it to the project once its tests pass (or the user accepts it)
+WORKSPACE_OVERLAY = os.getenv("WORKSPACE_OVERLAY", "0").lower() in ("1", "true", "on")
 console = Console()
 logger = setup_logger("main")
 logger.setLevel(LOG_LEVEL)
@@ -50,8 +55,15 @@ parser = argparse.ArgumentParser(description="My Engineer")
 parser.add_argument("--prompt-file", help="Path to the prompt file (optional)")
 parser.add_argument("--resume", help="Path to an existing run directory to resume from")
 parser.add_argument("--use-cursor", action="store_true", help="Use Cursor instead of VS Code as the editor")
+parser.add_argument("--stream", action="store_true", help="Stream the LLM response and start applying patches as soon as each one is complete")
 parser.add_argument("--include-tests", action="store_true", help="WIP - Include the tests file")
+parser.add_argument("--full-tests", action="store_true", help="Always run the whole test suite, even with TEST_SELECTION=1")
 parser.add_argument("--auto-fix-tests", action="store_true", help="WIP - Automatically attempt to fix failing tests (requires --include-tests)")
+subparsers = parser.add_subparsers(dest="command")
+usage_report_parser = subparsers.add_parser("usage-report", help="Aggregate LLM calls recorded in past runs into per-stage cost and latency totals")
+usage_report_parser.add_argument("--runs-dir", default="runs", help="Directory containing the run directories (default: runs)")
+rollback_parser = subparsers.add_parser("rollback", help="Undo the file writes of a turn, using its transaction journal")
+rollback_parser.add_argument("journal_dir", help="Transaction directory of the turn, e.g. runs/<run>/transactions/turn_1")
 args = parser.parse_args()
 
 def signal_handler(signum, frame):
@@ -61,9 +73,13 @@ def signal_handler(signum, frame):
 
 signal.signal(signal.SIGINT, signal_handler)
 
+def no_tests_ran(test_results: str) -> bool:
+    return "collected 0 items" in test_results or "no tests ran" in test_results
+
 def my_engineer_pipeline(prompt_file: Optional[str], include_tests: bool = False, resume: Optional[str] = None, use_cursor: bool = False):
     config = get_config()
     config.set('use_cursor', use_cursor)
+    config.set('stream_responses', args.stream)
     editor_command = get_editor_command()
     logger.info(f"Starting My Engineer pipeline")
     run_dir = setup_run_directory(prompt_file)
@@ -99,6 +115,7 @@ def my_engineer_pipeline(prompt_file: Optional[str], include_tests: bool = False
         logger.info(f"Use Cursor setting: {config.use_cursor}")
         conversation_state = ConversationManager.load_state(run_dir) or ConversationState.from_dict({})
         conversation_state.turn_number = 0
+        changed_paths = set()  # Files written during the run, relative to the project, for test selection
         logger.info(f"Conversation state previous_run: {conversation_state.previous_run}")
         while True:
             if resume:
@@ -124,7 +141,7 @@ def my_engineer_pipeline(prompt_file: Optional[str], include_tests: bool = False
                     else:
                         logger.info("Prompt was not post-processed (no changes made during post-processing).")
                 logger.info("Generating instructions based on smart context and user prompt")
-                run_dir_context = generate_instructions(prompt_content, llm_prompter, run_dir, conversation_state)
+                run_dir_context = generate_instructions(prompt_content, llm_prompter, run_dir, conversation_state, on_instruction=patch_processor.prefetch)
                 prompt_file_path = os.path.join(run_dir, "prompt_from_command_line.txt")
             console.print("[bold green]Processing instructions...")
             run_dir_context = process_instructions(run_dir_context, instruction_processor)
@@ -139,21 +156,40 @@ def my_engineer_pipeline(prompt_file: Optional[str], include_tests: bool = False
             else:
                 logger.warning("No commit name provided in the LLM response. Skipping branch creation.")
             logger.debug("Processing patches")
-            with console.status("[bold green]Processing patches...", spinner="dots") as status:
-                run_dir_context = process_patches(run_dir_context, patch_processor)
-            console.print("[bold green]Creating new files...")
-            run_dir_context = perform_file_operations(run_dir_context, file_operator)
+            # Every write of the turn lands on disk at once when the block completes, or not at all
+            test_results = None
+            with open_turn_transaction(run_dir, conversation_state.turn_number) as transaction:
+                workspace = WorkspaceOverlay(os.getcwd()) if WORKSPACE_OVERLAY else transaction
+                with console.status("[bold green]Processing patches...", spinner="dots") as status:
+                    run_dir_context = process_patches(run_dir_context, patch_processor, workspace)
+                console.print("[bold green]Creating new files...")
+                run_dir_context = perform_file_operations(run_dir_context, file_operator, workspace)
+                if WORKSPACE_OVERLAY:
+                    console.print("[bold cyan]Running unit tests on the staged changes...[/bold cyan]")
+                    turn_paths = list(workspace.changes)
+                    with workspace.materialized() as snapshot_dir:
+                        test_results = run_selected_tests(turn_paths, snapshot_dir, full=args.full_tests)
+                    if no_tests_ran(test_results) or check_test_results(test_results) or get_user_approval("Tests failed on the staged changes. Apply them to the project anyway?"):
+                        workspace.flush(transaction)
+                        changed_paths.update(turn_paths)
+                    else:
+                        console.print(f"[yellow]Discarded the changes of this turn ({len(workspace.changes)} file(s)).[/yellow]")
+                        workspace.discard()
             with open(os.path.join(run_dir, "conversation_state.json"), 'w', encoding='utf-8') as f:
                 json.dump(conversation_state.dict(), f, indent=2, cls=PydanticEncoder)
-            console.print("[bold cyan]Running unit tests...[/bold cyan]")
-            test_results = run_unit_tests()
+            if test_results is None:
+                # The transaction has been committed at this point
+                turn_paths = [os.path.relpath(path) for path in transaction.paths]
+                changed_paths.update(turn_paths)
+                console.print("[bold cyan]Running unit tests...[/bold cyan]")
+                test_results = run_selected_tests(turn_paths, full=args.full_tests)
             console.print(test_results)
             os.makedirs(run_dir, exist_ok=True)
             test_results_file = os.path.join(run_dir, f"test_results_turn_{conversation_state.turn_number}.txt")
             logger.info(f"Writing test results to: {test_results_file}")
             with open(test_results_file, 'w') as f:
                 f.write(test_results)
-            if "collected 0 items" not in test_results and "no tests ran" not in test_results:
+            if not no_tests_ran(test_results):
                 if not check_test_results(test_results):
                     append_test_results_to_next_prompt(run_dir, test_results, conversation_state.turn_number + 1)
 
@@ -170,9 +206,12 @@ def my_engineer_pipeline(prompt_file: Optional[str], include_tests: bool = False
         return None
 
     console.print("[bold cyan]Running final unit tests...[/bold cyan]")
-    final_test_results = run_unit_tests()
+    final_test_results = run_selected_tests(changed_paths, full=args.full_tests)
     console.print(final_test_results)
     console.print("[bold green]Pipeline execution completed.[/bold green]")
+    logger.info(f"LLM scheduler stats: {get_scheduler().stats()}")
+    if get_hedger().enabled:
+        logger.info(f"LLM hedging stats: {get_hedger().stats()}")
     logger.info(f"Pipeline execution completed. Results saved in {run_dir}")
     return run_dir_context
 
@@ -180,6 +219,15 @@ def main():
     # Load existing variables
     load_dotenv(dotenv_path=os.path.join(os.getcwd(), ".env"))
 
+    if args.command == "usage-report":
+        print_usage_report(args.runs_dir)
+        return
+
+    if args.command == "rollback":
+        restored = rollback_journal(args.journal_dir)
+        console.print(f"[bold green]Rolled back {restored} file(s) from {args.journal_dir}.[/bold green]")
+        return
+
     # Check if current directory is a Git repository
     if not is_git_repo():
         console.print("[bold red]Error: Not a Git repository.[/bold red]")
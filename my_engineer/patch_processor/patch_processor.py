@@ -1,10 +1,17 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from .src.patch_service import PatchService
+from .src.exceptions import MalformedPatchOutputError, PatchConflictError
 from ..llm_providers import get_provider
+from ..shared_models import PatchInstruction
 from ..shared_utils.logger import setup_logger
+from ..shared_utils.workspace_transaction import write_file
 import traceback
 import filecmp
 
+PREFETCH_WORKERS = int(os.getenv("PATCH_PREFETCH_WORKERS", 4))
+PATCH_WORKERS = int(os.getenv("PATCH_WORKERS", 4))
+
 class PatchProcessor:
     def __init__(self, run_dir):
         logger = setup_logger("patch_processor")
@@ -12,6 +19,8 @@ class PatchProcessor:
         self.__patch_service = PatchService(logger, haiku_provider, run_dir=run_dir)
         self.logger = setup_logger("patch_processor")
         self.run_dir = run_dir
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS)
+        self._prefetched = {}
 
     def apply_patch(self, original_content: str, patch_content: str, file_path: str) -> str:
         """
@@ -25,48 +34,142 @@ class PatchProcessor:
         """
         return self.__patch_service.apply_patch(original_content, patch_content, file_path)
 
-    def process_patches(self, patches, project_root):
+    def apply_patch_with_strategy(self, original_content: str, patch_content: str, file_path: str):
+        """Like apply_patch, but also returns how the patch was applied (local match strategy or llm:<model>)."""
+        return self.__patch_service.apply_patch_with_strategy(original_content, patch_content, file_path)
+
+    def apply_patches_with_strategy(self, original_content: str, patch_contents, file_path: str):
+        """Apply several patches to the same file in one pass. Returns the updated content and the strategy used."""
+        return self.__patch_service.apply_patches_with_strategy(original_content, patch_contents, file_path)
+
+    def prefetch(self, instruction, project_root=None):
+        """
+        Start applying a patch in the background while the rest of the LLM response is still streaming.
+        The result is only used by process_patches if the patch and the original file are unchanged by then.
+        """
+        if not isinstance(instruction, PatchInstruction):
+            return
+        key = (instruction.file_path, instruction.patch_content)
+        if key in self._prefetched:
+            return
+        full_path = os.path.join(project_root or os.getcwd(), instruction.file_path)
+        try:
+            with open(full_path, 'r') as f:
+                original_content = f.read()
+        except OSError as e:
+            self.logger.debug(f"Not prefetching patch for {instruction.file_path}: {str(e)}")
+            return
+        self.logger.info(f"Prefetching patch for file: {instruction.file_path}")
+        future = self._prefetch_executor.submit(self.apply_patch_with_strategy, original_content, instruction.patch_content, instruction.file_path)
+        self._prefetched[key] = (original_content, future)
+
+    def _apply_or_take_prefetched(self, original_content: str, patch) -> str:
+        prefetched = self._prefetched.pop((patch.file_path, patch.patch_content), None)
+        if prefetched and prefetched[0] == original_content:
+            self.logger.info(f"Using prefetched patch result for {patch.file_path}")
+            updated_content, patch.apply_strategy = prefetched[1].result()
+        else:
+            updated_content, patch.apply_strategy = self.apply_patch_with_strategy(original_content, patch.patch_content, patch.file_path)
+        self.logger.info(f"Patch for {patch.file_path} applied with strategy: {patch.apply_strategy}")
+        return updated_content
+
+    def process_patches(self, patches, project_root, workspace=None):
         """
         Process and apply patches to the actual project files.
+        Files are patched concurrently (PATCH_WORKERS at a time), the patches of one file in order.
+        Files are only written once every file has been processed, in the order of the patches.
+        With a workspace (WorkspaceTransaction or WorkspaceOverlay), files are read from and staged in it.
         """
+        patches_by_file = {}
         for patch in patches:
-            self.logger.info(f"Processing patch for file: {patch.file_path}")
-            try:
-                full_path = os.path.join(project_root, patch.file_path)
-                
-                with open(full_path, 'r') as f:
-                    original_content = f.read()
-                    original_first_line = original_content.split('\n')[0] if original_content else ""
+            patches_by_file.setdefault(patch.file_path, []).append(patch)
 
-                try:
-                    updated_content = self.apply_patch(original_content, patch.patch_content, patch.file_path)
-                except ValueError as e:
-                    self.logger.error(f"Error processing patch for {patch.file_path}: {str(e)}.")
-                    self.logger.error("Skipping this patch due to file size exceeding maximum token limit.")
-                    continue
-                except Exception as e:
-                    self.logger.error(f"Unexpected error processing patch for {patch.file_path}: {str(e)}")
-                    continue
-                
-                updated_lines = updated_content.split('\n')
-                if updated_lines[0] != original_first_line:
-                    self.logger.info(f"First line changed in {patch.file_path}")
-                    if updated_lines[0].strip() == "":
-                        self.logger.warning(f"First line became empty in {patch.file_path}, preserving original")
-                        updated_lines[0] = original_first_line
-                        updated_content = '\n'.join(updated_lines)
+        with ThreadPoolExecutor(max_workers=PATCH_WORKERS) as executor:
+            futures = {
+                file_path: executor.submit(self._apply_file_patches, file_patches, project_root, workspace)
+                for file_path, file_patches in patches_by_file.items()
+            }
+        results = {}
+        for file_path, future in futures.items():
+            try:
+                results[file_path] = future.result()
+            except Exception as e:
+                self.logger.error(f"Error processing patches for {file_path}: {str(e)}")
+                self.logger.error(f"Traceback: {traceback.format_exc()}")
 
+        for file_path, (full_path, original_content, updated_content, applied_patches) in results.items():
+            try:
                 # Compare the updated content with the original content
                 if updated_content != original_content:
                     # Content is different, so we proceed with the update
-                    with open(full_path, 'w') as f:
-                        f.write(updated_content)
+                    write_file(full_path, updated_content, workspace)
                     self.logger.info(f"Successfully updated file: {full_path}")
                 else:
                     # Content is identical, no need to update
                     self.logger.info(f"No changes applied to file: {full_path}")
+                for patch in applied_patches:
+                    patch.processed_patch_path = full_path  # Mark as processed
+            except Exception as e:
+                self.logger.error(f"Error writing patched file {full_path}: {str(e)}")
+                self.logger.error(f"Traceback: {traceback.format_exc()}")
+
+    def _apply_file_patches(self, patches, project_root, workspace=None):
+        full_path = os.path.join(project_root, patches[0].file_path)
+        if workspace is not None:
+            original_content = workspace.read(full_path)
+        else:
+            with open(full_path, 'r') as f:
+                original_content = f.read()
 
-                patch.processed_patch_path = full_path  # Mark as processed
+        if len(patches) > 1:
+            return self._apply_coalesced_patches(full_path, original_content, patches)
+
+        content = original_content
+        applied_patches = []
+        for patch in patches:
+            self.logger.info(f"Processing patch for file: {patch.file_path}")
+            original_first_line = content.split('\n')[0] if content else ""
+            try:
+                updated_content = self._apply_or_take_prefetched(content, patch)
+            except MalformedPatchOutputError as e:
+                self.logger.error(f"Error processing patch for {patch.file_path}: {str(e)}.")
+                self.logger.error("Skipping this patch, every model returned malformed output.")
+                continue
+            except ValueError as e:
+                self.logger.error(f"Error processing patch for {patch.file_path}: {str(e)}.")
+                self.logger.error("Skipping this patch, the file is too large and the region it changes could not be located.")
+                continue
             except Exception as e:
-                self.logger.error(f"Error processing patch for {patch.file_path}: {str(e)}")
-                self.logger.error(f"Traceback: {traceback.format_exc()}")
\ No newline at end of file
+                self.logger.error(f"Unexpected error processing patch for {patch.file_path}: {str(e)}")
+                continue
+
+            updated_lines = updated_content.split('\n')
+            if updated_lines[0] != original_first_line:
+                self.logger.info(f"First line changed in {patch.file_path}")
+                if updated_lines[0].strip() == "":
+                    self.logger.warning(f"First line became empty in {patch.file_path}, preserving original")
+                    updated_lines[0] = original_first_line
+                    updated_content = '\n'.join(updated_lines)
+            content = updated_content
+            applied_patches.append(patch)
+        return full_path, original_content, content, applied_patches
+
+    def _apply_coalesced_patches(self, full_path, original_content, patches):
+        file_path = patches[0].file_path
+        self.logger.info(f"Applying {len(patches)} patches for file {file_path} in one pass")
+        for patch in patches:
+            prefetched = self._prefetched.pop((patch.file_path, patch.patch_content), None)
+            if prefetched:
+                prefetched[1].cancel()
+        try:
+            updated_content, strategy = self.apply_patches_with_strategy(original_content, [patch.patch_content for patch in patches], file_path)
+        except PatchConflictError as e:
+            self.logger.error(f"Conflicting patches for {file_path}: {str(e)}. Skipping this file.")
+            return full_path, original_content, original_content, []
+        except Exception as e:
+            self.logger.error(f"Error processing patches for {file_path}: {str(e)}")
+            return full_path, original_content, original_content, []
+        for patch in patches:
+            patch.apply_strategy = strategy
+        self.logger.info(f"Patches for {file_path} applied with strategy: {strategy}")
+        return full_path, original_content, updated_content, patches
@@ -0,0 +1,15 @@
+class MalformedPatchOutputError(ValueError):
+    """Exception raised when the model's answer to a patch request cannot be used as the updated file."""
+    pass
+
+class LocalPatchError(Exception):
+    """Exception raised when a patch cannot be applied without an LLM."""
+    pass
+
+class PatchConflictError(LocalPatchError):
+    """Exception raised when several patches for the same file change overlapping lines."""
+    pass
+
+class InvalidPatchOutputError(MalformedPatchOutputError):
+    """Exception raised when a patched file fails validation (syntax, truncation, placeholders, stray fences)."""
+    pass
@@ -0,0 +1,357 @@
+import os
+import re
+import difflib
+from typing import List, Optional, Tuple
+from pydantic import BaseModel
+from .exceptions import LocalPatchError, PatchConflictError
+
+FUZZY_THRESHOLD = float(os.getenv("PATCH_FUZZY_THRESHOLD", 0.85))
+STRATEGIES = ("strict", "whitespace", "fuzzy")
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+\d+(?:,\d+)? @@')
+SEARCH_MARKER = re.compile(r'^<{5,}\s*SEARCH\s*$')
+DIVIDER_MARKER = re.compile(r'^={5,}\s*$')
+REPLACE_MARKER = re.compile(r'^>{5,}\s*REPLACE\s*$')
+
+
+class Hunk(BaseModel):
+    old_lines: List[str]
+    new_lines: List[str]
+    old_start: Optional[int] = None  # 1-based line number hint from the @@ header
+    diff: List[str] = []  # The hunk body in order, each line prefixed with ' ', '-' or '+'
+
+
+class LocatedHunk(BaseModel):
+    start: int  # 0-based, inclusive
+    end: int  # 0-based, exclusive
+    new_lines: List[str]
+    strategy: str
+
+
+class LocalPatchResult(BaseModel):
+    content: str
+    strategy: str
+    hunks: List[LocatedHunk]
+
+
+def _parse_search_replace(lines: List[str]) -> List[Hunk]:
+    hunks = []
+    section = None
+    old_lines, new_lines = [], []
+    for line in lines:
+        if SEARCH_MARKER.match(line):
+            section, old_lines, new_lines = "search", [], []
+        elif DIVIDER_MARKER.match(line) and section == "search":
+            section = "replace"
+        elif REPLACE_MARKER.match(line) and section == "replace":
+            hunks.append(_with_diff(Hunk(old_lines=old_lines, new_lines=new_lines)))
+            section = None
+        elif section == "search":
+            old_lines.append(line)
+        elif section == "replace":
+            new_lines.append(line)
+    if section is not None:
+        raise LocalPatchError("Unterminated SEARCH/REPLACE block")
+    return hunks
+
+
+def _with_diff(hunk: Hunk) -> Hunk:
+    """Fill in the diff of a SEARCH/REPLACE hunk: lines kept by the replacement are context, the others are removed or added."""
+    diff = []
+    matcher = difflib.SequenceMatcher(None, hunk.old_lines, hunk.new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            diff.extend(' ' + line for line in hunk.old_lines[i1:i2])
+        else:
+            diff.extend('-' + line for line in hunk.old_lines[i1:i2])
+            diff.extend('+' + line for line in hunk.new_lines[j1:j2])
+    hunk.diff = diff
+    return hunk
+
+
+def _parse_unified_diff(lines: List[str]) -> List[Hunk]:
+    hunks = []
+    current = None
+    for line in lines:
+        # File headers only come before the first hunk; inside one, "--- x" is a removed "-- x" line
+        if current is None and (line.startswith('--- ') or line.startswith('+++ ')):
+            continue
+        header = HUNK_HEADER.match(line)
+        if header or line.startswith('@@'):
+            old_start = None
+            if header:
+                # With an empty old range, the start is the line after which the new lines go
+                old_start = int(header.group(1)) + 1 if header.group(2) == '0' else int(header.group(1))
+            current = Hunk(old_lines=[], new_lines=[], old_start=old_start)
+            hunks.append(current)
+            continue
+        if line.startswith('\\'):  # "\ No newline at end of file"
+            continue
+        if current is None:
+            current = Hunk(old_lines=[], new_lines=[])
+            hunks.append(current)
+        if line.startswith('-'):
+            current.old_lines.append(line[1:])
+            current.diff.append(line)
+        elif line.startswith('+'):
+            current.new_lines.append(line[1:])
+            current.diff.append(line)
+        else:
+            # Context line; models often drop the leading space of blank or unindented lines
+            context = line[1:] if line.startswith(' ') else line
+            current.old_lines.append(context)
+            current.new_lines.append(context)
+            current.diff.append(' ' + context)
+    return hunks
+
+
+def _trim_context(hunk: Hunk) -> Hunk:
+    # Trailing blank context lines are usually an artifact of the fence, not part of the file
+    diff = list(hunk.diff)
+    while diff and diff[-1] == ' ':
+        diff.pop()
+    return Hunk(old_lines=[line[1:] for line in diff if line[0] != '+'],
+                new_lines=[line[1:] for line in diff if line[0] != '-'],
+                old_start=hunk.old_start, diff=diff)
+
+
+def parse_patch(patch_content: str) -> List[Hunk]:
+    """Parse a unified diff or SEARCH/REPLACE blocks into hunks. Raises LocalPatchError if there is nothing to apply."""
+    lines = patch_content.split('\n')
+    if any(SEARCH_MARKER.match(line) for line in lines):
+        hunks = _parse_search_replace(lines)
+    else:
+        hunks = [_trim_context(hunk) for hunk in _parse_unified_diff(lines)]
+    hunks = [hunk for hunk in hunks if hunk.old_lines != hunk.new_lines]
+    if not hunks:
+        raise LocalPatchError("Patch contains no changes")
+    return hunks
+
+
+def _normalize(line: str) -> str:
+    return ' '.join(line.split())
+
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+class LocalPatchEngine:
+    """
+    Applies unified diffs and SEARCH/REPLACE blocks without an LLM.
+
+    Each hunk is located with the strictest strategy that finds it: exact match, then
+    whitespace-insensitive, then fuzzy. The fuzzy strategy aligns the hunk with the file line by
+    line (difflib ratio of at least PATCH_FUZZY_THRESHOLD): context lines may be missing from the
+    file or the patch, but every removed line must be found, and file lines the patch left out
+    are kept.
+    Hunks must apply in order and without overlapping. Locating and splicing are separate
+    steps so callers can inspect or combine the spans before changing the file.
+    """
+
+    def __init__(self, fuzzy_threshold: float = FUZZY_THRESHOLD):
+        self.fuzzy_threshold = fuzzy_threshold
+
+    def apply(self, original_content: str, patch_content: str) -> LocalPatchResult:
+        located = self.locate(original_content, patch_content)
+        return LocalPatchResult(
+            content=self.splice(original_content, located),
+            strategy=self.weakest_strategy(located),
+            hunks=located,
+        )
+
+    def apply_many(self, original_content: str, patch_contents: List[str]) -> LocalPatchResult:
+        """
+        Apply several patches written against the same original file in a single pass.
+        Raises PatchConflictError when hunks of different patches touch overlapping lines.
+        """
+        located = []  # (patch number, hunk)
+        for number, patch_content in enumerate(patch_contents, 1):
+            located.extend((number, hunk) for hunk in self.locate(original_content, patch_content))
+
+        ordered = sorted(located, key=lambda item: (item[1].start, item[1].end))
+        for (first_patch, first), (second_patch, second) in zip(ordered, ordered[1:]):
+            if second.start < first.end or (first.start == second.start and first.end > first.start and second.end > second.start):
+                raise PatchConflictError(
+                    f"Patch {first_patch} (lines {first.start + 1}-{first.end}) and patch {second_patch} "
+                    f"(lines {second.start + 1}-{second.end}) change overlapping lines"
+                )
+
+        hunks = [hunk for _, hunk in located]
+        return LocalPatchResult(
+            content=self.splice(original_content, hunks),
+            strategy=self.weakest_strategy(hunks),
+            hunks=hunks,
+        )
+
+    @staticmethod
+    def weakest_strategy(located: List[LocatedHunk]) -> str:
+        return max((hunk.strategy for hunk in located), key=STRATEGIES.index)
+
+    def locate(self, original_content: str, patch_content: str) -> List[LocatedHunk]:
+        lines = original_content.split('\n')
+        located = []
+        search_from = 0
+        for number, hunk in enumerate(parse_patch(patch_content), 1):
+            match = self._locate_hunk(lines, hunk, search_from)
+            if match is None:
+                raise LocalPatchError(f"Hunk {number} does not match the file")
+            located.append(match)
+            search_from = match.end
+        return located
+
+    def _locate_hunk(self, lines: List[str], hunk: Hunk, search_from: int) -> Optional[LocatedHunk]:
+        hint = hunk.old_start - 1 if hunk.old_start else search_from
+        if not hunk.old_lines:
+            # Pure insertion: only safe with a line number to anchor it
+            if hunk.old_start is None or not search_from <= hint <= len(lines):
+                return None
+            return LocatedHunk(start=hint, end=hint, new_lines=hunk.new_lines, strategy="strict")
+
+        size = len(hunk.old_lines)
+        candidates = range(search_from, len(lines) - size + 1)
+        for strategy in STRATEGIES:
+            if strategy == "fuzzy":
+                match = self._find_fuzzy(lines, hunk, search_from, hint)
+                if match is None:
+                    return None
+                start, end, new_lines = match
+                if lines and lines[0].endswith('\r'):
+                    new_lines = [line if line.endswith('\r') else line + '\r' for line in new_lines]
+                return LocatedHunk(start=start, end=end, new_lines=new_lines, strategy=strategy)
+            span = self._find(lines, hunk.old_lines, candidates, hint, strategy)
+            if span is not None:
+                new_lines = hunk.new_lines
+                if strategy != "strict":
+                    new_lines = self._reindent(lines[span:span + size], hunk.old_lines, new_lines)
+                if lines and lines[0].endswith('\r'):
+                    new_lines = [line if line.endswith('\r') else line + '\r' for line in new_lines]
+                return LocatedHunk(start=span, end=span + size, new_lines=new_lines, strategy=strategy)
+        return None
+
+    def _find(self, lines: List[str], old_lines: List[str], candidates: range, hint: int, strategy: str) -> Optional[int]:
+        size = len(old_lines)
+        # Prefer the match closest to the line number given by the patch
+        ordered = sorted(candidates, key=lambda start: abs(start - hint))
+        if strategy == "strict":
+            stripped = [line.rstrip('\r') for line in old_lines]
+            return next((start for start in ordered if [line.rstrip('\r') for line in lines[start:start + size]] == stripped), None)
+        normalized = [_normalize(line) for line in old_lines]
+        return next((start for start in ordered if [_normalize(line) for line in lines[start:start + size]] == normalized), None)
+
+    def _find_fuzzy(self, lines: List[str], hunk: Hunk, search_from: int, hint: int) -> Optional[Tuple[int, int, List[str]]]:
+        """The best aligned span of the file for the hunk and its replacement, or None when no span is safe to patch."""
+        if not hunk.diff:
+            hunk = _with_diff(hunk.model_copy())
+        old_lines = [line[1:] for line in hunk.diff if line[0] != '+']
+        removed = [line[0] == '-' for line in hunk.diff if line[0] != '+']
+        normalized_lines = [_normalize(line) for line in lines]
+        size = len(old_lines)
+        slack = max(2, size // 4)  # File lines the patch may have left out
+        matcher = difflib.SequenceMatcher(autojunk=False)
+        matcher.set_seq2([_normalize(line) for line in old_lines])
+
+        removed_lines = {_normalize(line) for line, is_removed in zip(old_lines, removed) if is_removed}
+        text_matcher = difflib.SequenceMatcher(autojunk=False)
+        text_matcher.set_seq2('\n'.join(_normalize(line) for line in old_lines))
+
+        best, best_ratio, seen = None, self.fuzzy_threshold, set()
+        for start in sorted(range(search_from, len(lines)), key=lambda start: abs(start - hint)):
+            region = normalized_lines[start:start + size + slack]
+            if not removed_lines.issubset(region):
+                continue
+            matcher.set_seq1(region)
+            if matcher.quick_ratio() < 0.5:
+                continue
+            alignment = self._align(matcher.get_opcodes(), removed)
+            if alignment is None:
+                continue
+            mapping = {old: start + index for old, index in alignment[0].items()}
+            skipped = {start + index for index in alignment[1]}
+            span = (min(mapping.values()), max(mapping.values()) + 1)
+            if span in seen:
+                continue
+            seen.add(span)
+            # File lines the hunk skipped are kept as they are, so they do not count against the match
+            text_matcher.set_seq1('\n'.join(normalized_lines[index] for index in range(*span) if index not in skipped))
+            ratio = text_matcher.ratio()
+            if ratio > best_ratio:
+                best, best_ratio = (span, mapping), ratio
+        if best is None:
+            return None
+        (start, end), mapping = best
+        return start, end, self._fuzzy_replacement(lines, hunk, start, end, mapping)
+
+    @staticmethod
+    def _align(opcodes, removed: List[bool]) -> Optional[Tuple[dict, List[int]]]:
+        """
+        Map old line indexes to region indexes, and list the region lines the hunk skipped. None when
+        a removed line is not matched exactly or nothing matched.
+        """
+        mapping, skipped = {}, []
+        for tag, region_start, region_end, old_start, old_end in opcodes:
+            if tag == 'equal':
+                mapping.update((old_start + offset, region_start + offset) for offset in range(old_end - old_start))
+            elif any(removed[old_start:old_end]):
+                # Only context lines may differ from the file or be missing from it
+                return None
+            elif tag == 'delete':
+                skipped.extend(range(region_start, region_end))
+        return (mapping, skipped) if mapping else None
+
+    def _fuzzy_replacement(self, lines: List[str], hunk: Hunk, start: int, end: int, mapping: dict) -> List[str]:
+        """
+        Walk the hunk over the span: matched context lines keep the file's version, removed lines are
+        dropped, added lines are inserted where the hunk has them and file lines the hunk skipped are kept.
+        """
+        matched_old = [line[1:] for line in hunk.diff if line[0] != '+']
+        pairs = [(lines[file_index], matched_old[old_index]) for old_index, file_index in sorted(mapping.items())]
+        added = self._reindent([file_line for file_line, _ in pairs], [old_line for _, old_line in pairs],
+                               [line[1:] for line in hunk.diff if line[0] == '+'])
+        result, position, old_index, added_index = [], start, 0, 0
+        for line in hunk.diff:
+            if line[0] == '+':
+                result.append(added[added_index])
+                added_index += 1
+                continue
+            file_index = mapping.get(old_index)
+            old_index += 1
+            if file_index is None:
+                continue  # Context the file does not have
+            result.extend(lines[position:file_index])
+            if line[0] == ' ':
+                result.append(lines[file_index])
+            position = file_index + 1
+        result.extend(lines[position:end])
+        return result
+
+    @staticmethod
+    def _reindent(file_lines: List[str], old_lines: List[str], new_lines: List[str]) -> List[str]:
+        """Give the new lines the file's indentation, using the context lines to map the patch's indentation levels."""
+        mapping = {}
+        for file_line, old_line in zip(file_lines, old_lines):
+            if file_line.strip() and old_line.strip():
+                mapping.setdefault(_indent(old_line), _indent(file_line))
+        if all(patch_indent == file_indent for patch_indent, file_indent in mapping.items()):
+            return new_lines
+
+        reindented = []
+        for line in new_lines:
+            if not line.strip():
+                reindented.append(line)
+                continue
+            indent = _indent(line)
+            # Deeper levels not seen in the context keep their extra indentation on top of the closest known level
+            known = max((patch_indent for patch_indent in mapping if indent.startswith(patch_indent)), key=len, default=None)
+            reindented.append(line if known is None else mapping[known] + line[len(known):])
+        return reindented
+
+    @staticmethod
+    def splice(original_content: str, located: List[LocatedHunk]) -> str:
+        lines = original_content.split('\n')
+        # Bottom-up so earlier spans keep their positions; at the same line, replacements go before
+        # insertions and insertions keep their patch order
+        order = sorted(range(len(located)), key=lambda index: (located[index].start, located[index].end, index), reverse=True)
+        for index in order:
+            lines[located[index].start:located[index].end] = located[index].new_lines
+        return '\n'.join(lines)
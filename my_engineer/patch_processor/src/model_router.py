@@ -0,0 +1,162 @@
+import os
+import json
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+from ...shared_utils.logger import setup_logger
+
+HAIKU_TOKEN_LIMIT = 3500
+SONNET_TOKEN_LIMIT = 7500
+
+HAIKU = "haiku"
+SONNET = "sonnet"
+
+ROUTING_STATS_FILE = os.getenv("MODEL_ROUTING_STATS_FILE", os.path.join("runs", "model_routing_stats.json"))
+MIN_SUCCESS_RATE = float(os.getenv("MODEL_ROUTING_MIN_SUCCESS_RATE", 0.8))
+MIN_SAMPLES = int(os.getenv("MODEL_ROUTING_MIN_SAMPLES", 5))
+COMPLEX_PATCH_HUNKS = int(os.getenv("MODEL_ROUTING_COMPLEX_HUNKS", 6))
+COMPLEX_PATCH_CHANGED_LINES = int(os.getenv("MODEL_ROUTING_COMPLEX_CHANGED_LINES", 150))
+# How much slower than Sonnet, retries included, Haiku may be expected to be before Sonnet is preferred
+LATENCY_TOLERANCE = float(os.getenv("MODEL_ROUTING_LATENCY_TOLERANCE", 1.5))
+
+LANGUAGES = {
+    ".py": "python", ".js": "javascript", ".jsx": "javascript", ".ts": "typescript", ".tsx": "typescript",
+    ".json": "json", ".yaml": "yaml", ".yml": "yaml", ".md": "markdown", ".html": "html", ".css": "css",
+    ".sh": "shell", ".sql": "sql", ".go": "go", ".rs": "rust", ".java": "java", ".rb": "ruby",
+}
+
+
+class PatchFeatures(BaseModel):
+    file_path: str
+    language: str
+    token_count: int
+    hunk_count: int
+    changed_lines: int
+
+
+def compute_patch_features(patch_content: str, file_path: str, token_count: int) -> PatchFeatures:
+    lines = patch_content.split('\n')
+    hunk_count = sum(1 for line in lines if line.startswith('@@'))
+    changed_lines = sum(
+        1 for line in lines
+        if line[:1] in ('+', '-') and not line.startswith('+++') and not line.startswith('---')
+    )
+    return PatchFeatures(
+        file_path=file_path,
+        language=LANGUAGES.get(os.path.splitext(file_path)[1].lower(), "other"),
+        token_count=token_count,
+        hunk_count=max(hunk_count, 1),
+        changed_lines=changed_lines,
+    )
+
+
+class ModelStats:
+    """Per-model, per-language success rate and latency of patch applications, persisted across runs."""
+
+    def __init__(self, stats_file: str = ROUTING_STATS_FILE):
+        self.stats_file = stats_file
+        self.logger = setup_logger("ModelStats")
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Dict[str, float]]] = self._load()
+
+    def _load(self):
+        if os.path.exists(self.stats_file):
+            try:
+                with open(self.stats_file, 'r') as f:
+                    return json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                self.logger.warning(f"Could not read model routing stats from {self.stats_file}: {str(e)}")
+        return {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.stats_file) or ".", exist_ok=True)
+        tmp_path = f"{self.stats_file}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._stats, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.stats_file)
+
+    def record(self, model: str, language: str, success: bool, latency_seconds: float) -> None:
+        with self._lock:
+            entry = self._stats.setdefault(model, {}).setdefault(language, {"attempts": 0, "successes": 0, "total_latency_seconds": 0.0})
+            entry["attempts"] += 1
+            entry["successes"] += 1 if success else 0
+            entry["total_latency_seconds"] = round(entry["total_latency_seconds"] + latency_seconds, 3)
+            try:
+                self._save()
+            except OSError as e:
+                self.logger.warning(f"Could not save model routing stats: {str(e)}")
+
+    def get(self, model: str, language: str) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._stats.get(model, {}).get(language, {"attempts": 0, "successes": 0, "total_latency_seconds": 0.0}))
+
+    def success_rate(self, model: str, language: str) -> Optional[float]:
+        entry = self.get(model, language)
+        if entry["attempts"] < MIN_SAMPLES:
+            return None
+        return entry["successes"] / entry["attempts"]
+
+    def average_latency(self, model: str, language: str) -> Optional[float]:
+        entry = self.get(model, language)
+        if entry["attempts"] < MIN_SAMPLES:
+            return None
+        return entry["total_latency_seconds"] / entry["attempts"]
+
+
+class RoutingPolicy(ABC):
+    @abstractmethod
+    def route(self, features: PatchFeatures, stats: ModelStats, models: Dict[str, str]) -> List[str]:
+        """
+        Return the models to try, in order: the first one is used, the next ones are escalations
+        when a model produces malformed output. `models` maps route names to model ids.
+        """
+        pass
+
+
+class DefaultRoutingPolicy(RoutingPolicy):
+    """
+    Haiku first, escalating to Sonnet, unless the file is too big for Haiku, the patch is complex,
+    or Haiku's observed success rate on this language is too low, or its expected latency including
+    escalations is well above Sonnet's.
+    """
+
+    def route(self, features: PatchFeatures, stats: ModelStats, models: Dict[str, str]) -> List[str]:
+        if features.token_count > SONNET_TOKEN_LIMIT:
+            raise ValueError(f"Input file is too big even for Sonnet. Token count: {features.token_count}, limit: {SONNET_TOKEN_LIMIT}")
+        if features.token_count > HAIKU_TOKEN_LIMIT:
+            return [SONNET]
+        if features.hunk_count >= COMPLEX_PATCH_HUNKS or features.changed_lines >= COMPLEX_PATCH_CHANGED_LINES:
+            return [SONNET]
+
+        haiku_success = stats.success_rate(models[HAIKU], features.language)
+        if haiku_success is not None and haiku_success < MIN_SUCCESS_RATE:
+            return [SONNET]
+
+        haiku_latency = stats.average_latency(models[HAIKU], features.language)
+        sonnet_latency = stats.average_latency(models[SONNET], features.language)
+        if haiku_success is not None and haiku_latency is not None and sonnet_latency is not None:
+            expected_haiku_latency = haiku_latency + (1 - haiku_success) * sonnet_latency
+            if expected_haiku_latency > sonnet_latency * LATENCY_TOLERANCE:
+                return [SONNET]
+
+        return [HAIKU, SONNET]
+
+
+class ModelRouter:
+    def __init__(self, models: Dict[str, str], policy: Optional[RoutingPolicy] = None, stats: Optional[ModelStats] = None):
+        self.models = models
+        self.policy = policy or DefaultRoutingPolicy()
+        self.stats = stats or ModelStats()
+        self.logger = setup_logger("ModelRouter")
+
+    def route(self, features: PatchFeatures) -> List[str]:
+        route = self.policy.route(features, self.stats, self.models)
+        self.logger.info(
+            f"Routing patch for {features.file_path} ({features.language}, {features.token_count} tokens, "
+            f"{features.hunk_count} hunks, {features.changed_lines} changed lines) to: {' -> '.join(route)}"
+        )
+        return route
+
+    def record(self, route_name: str, features: PatchFeatures, success: bool, latency_seconds: float) -> None:
+        self.stats.record(self.models[route_name], features.language, success, latency_seconds)
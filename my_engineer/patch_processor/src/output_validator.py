@@ -0,0 +1,92 @@
+import os
+import re
+import ast
+import json
+import difflib
+from typing import List
+import yaml
+from .local_patch_engine import parse_patch
+from .exceptions import InvalidPatchOutputError, LocalPatchError
+
+# A result smaller than this fraction of the original, that also drops lines the patch does not remove, is taken as truncated
+MIN_SIZE_RATIO = float(os.getenv("PATCH_VALIDATION_MIN_SIZE_RATIO", 0.7))
+UNEXPLAINED_REMOVAL_SLACK = 20
+
+PLACEHOLDER = re.compile(
+    r'(rest of (the )?(code|file|function|class|method|implementation)'
+    r'|remaining (code|methods|functions|implementation)'
+    r'|(existing|previous|other|original) code( here| unchanged| remains)?'
+    r'|(code|file|everything else) (remains|stays|is) (the same|unchanged)'
+    r'|\.\.\.\s*(unchanged|existing|rest))',
+    re.IGNORECASE,
+)
+COMMENT_PREFIXES = ('#', '//', '/*', '*', '<!--', '...')
+
+
+def _normalize(line: str) -> str:
+    return ' '.join(line.split())
+
+
+def _parses(content: str, file_path: str) -> bool:
+    try:
+        _parse(content, file_path)
+        return True
+    except Exception:
+        return False
+
+
+def _parse(content: str, file_path: str) -> None:
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.py':
+        compile(content, file_path, 'exec', dont_inherit=True)
+    elif extension == '.json':
+        json.loads(content)
+    elif extension in ('.yaml', '.yml'):
+        list(yaml.safe_load_all(content))
+
+
+def _removable_lines(patch_content: str) -> int:
+    try:
+        return sum(len(hunk.old_lines) for hunk in parse_patch(patch_content))
+    except LocalPatchError:
+        return sum(1 for line in patch_content.split('\n') if line.startswith('-') and not line.startswith('---'))
+
+
+def find_problems(original_content: str, updated_content: str, patch_content: str, file_path: str) -> List[str]:
+    """Cheap checks of a patched file before it is written. Returns a description of each problem found."""
+    problems = []
+    original_lines = original_content.split('\n')
+    updated_lines = updated_content.split('\n')
+    patch_lines = {_normalize(line.lstrip('+-')) for line in patch_content.split('\n')}
+    original_set = {_normalize(line) for line in original_lines}
+    added = [line for line in updated_lines if _normalize(line) not in original_set and _normalize(line) not in patch_lines]
+
+    # Syntax, only blamed on the patch when the original file was valid
+    try:
+        _parse(updated_content, file_path)
+    except Exception as e:
+        if not original_content.strip() or _parses(original_content, file_path):
+            problems.append(f"does not parse: {str(e).splitlines()[0] if str(e) else type(e).__name__}")
+
+    stray_fences = [line for line in added if line.strip().startswith('```')]
+    if stray_fences:
+        problems.append(f"contains {len(stray_fences)} stray code fence line(s)")
+
+    placeholders = [line.strip() for line in added if line.strip().startswith(COMMENT_PREFIXES) and PLACEHOLDER.search(line)]
+    if placeholders:
+        problems.append(f"contains placeholder comment(s) such as {placeholders[0]!r}")
+
+    if len(original_lines) > UNEXPLAINED_REMOVAL_SLACK and len(updated_content) < MIN_SIZE_RATIO * len(original_content):
+        matcher = difflib.SequenceMatcher(None, original_lines, updated_lines, autojunk=False)
+        removed = sum(i2 - i1 for tag, i1, i2, _, _ in matcher.get_opcodes() if tag in ('delete', 'replace'))
+        if removed > 2 * _removable_lines(patch_content) + UNEXPLAINED_REMOVAL_SLACK:
+            problems.append(f"is {len(updated_content) * 100 // max(len(original_content), 1)}% of the original size and "
+                            f"drops {removed} lines the patch does not remove (truncated?)")
+    return problems
+
+
+def validate_patched_output(original_content: str, updated_content: str, patch_content: str, file_path: str) -> None:
+    """Raises InvalidPatchOutputError when the patched file looks broken."""
+    problems = find_problems(original_content, updated_content, patch_content, file_path)
+    if problems:
+        raise InvalidPatchOutputError(f"Patched {file_path} {'; '.join(problems)}")
@@ -0,0 +1,65 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, Optional, Tuple
+from ...shared_utils.logger import setup_logger
+
+PATCH_CACHE_DIR = os.getenv("PATCH_CACHE_DIR", os.path.join("runs", "patch_cache"))
+# Bump to invalidate every entry when the way LLM output is turned into file content changes
+PATCH_CACHE_VERSION = "1"
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class PatchCache:
+    """
+    Disk cache of patched files produced by an LLM, so resuming a run or replaying the same
+    instructions does not pay for identical patches twice. The key covers the original content,
+    the patch, and the models and prompt templates that would produce the answer.
+    """
+
+    def __init__(self, models: Dict[str, str], prompts: Dict[str, str], cache_dir: str = PATCH_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.logger = setup_logger("PatchCache")
+        self._lock = threading.Lock()
+        version = {
+            "version": PATCH_CACHE_VERSION,
+            "models": models,
+            "prompts": {name: _sha256(prompt) for name, prompt in prompts.items()},
+        }
+        self.version_hash = _sha256(json.dumps(version, sort_keys=True))
+
+    def key(self, original_content: str, patch_content: str) -> str:
+        return _sha256(f"{_sha256(original_content)}:{_sha256(patch_content)}:{self.version_hash}")
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, original_content: str, patch_content: str) -> Optional[Tuple[str, str]]:
+        """The cached (content, strategy), or None."""
+        path = self._entry_path(self.key(original_content, patch_content))
+        with self._lock:
+            if not os.path.exists(path):
+                return None
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                self.logger.warning(f"Ignoring unreadable patch cache entry {path}: {str(e)}")
+                return None
+        return entry["content"], entry["strategy"]
+
+    def put(self, original_content: str, patch_content: str, content: str, strategy: str) -> None:
+        path = self._entry_path(self.key(original_content, patch_content))
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({"content": content, "strategy": strategy}, f)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                self.logger.warning(f"Could not save patch cache entry: {str(e)}")
@@ -1,12 +1,31 @@
 import os
 import sys
+import time
 import traceback
 from datetime import datetime
 import anthropic
 from importlib import resources  # For Python 3.7+
+from ...llm_providers.providers.utils import cacheable_text
+from ...llm_providers.providers.telemetry import llm_stage
+from .model_router import ModelRouter, compute_patch_features, HAIKU, SONNET, HAIKU_TOKEN_LIMIT, SONNET_TOKEN_LIMIT
+from .local_patch_engine import LocalPatchEngine
+from .patch_window import find_patch_window
+from .patch_cache import PatchCache
+from .output_validator import validate_patched_output
+from .exceptions import MalformedPatchOutputError, InvalidPatchOutputError, LocalPatchError, PatchConflictError
 
-HAIKU_TOKEN_LIMIT = 3500
-SONNET_TOKEN_LIMIT = 7500
+# Try to apply diffs and SEARCH/REPLACE blocks locally before asking an LLM to rewrite the file
+PATCH_LOCAL_ENGINE = os.getenv("PATCH_LOCAL_ENGINE", "1").lower() in ("1", "true", "on")
+# Reuse the LLM result for a patch already applied to the same file content
+PATCH_CACHE = os.getenv("PATCH_CACHE", "1").lower() in ("1", "true", "on")
+# "hunks": the model returns SEARCH/REPLACE blocks that are applied locally, with a full-file
+# answer from the last model as the fallback. "file": the model returns the whole updated file.
+PATCH_OUTPUT_MODE = os.getenv("PATCH_OUTPUT_MODE", "hunks").lower()
+OUTPUT_MODES = ("hunks", "file")
+# Check patched files (syntax, truncation, placeholders, stray fences) before they are returned for writing
+PATCH_VALIDATION = os.getenv("PATCH_VALIDATION", "1").lower() in ("1", "true", "on")
+# Retries of the same model, told what failed, when its patched file does not pass validation
+PATCH_VALIDATION_RETRIES = int(os.getenv("PATCH_VALIDATION_RETRIES", 1))
 
 class PatchService:
     def __init__(self, logger, llm_provider, run_dir):
@@ -15,8 +34,24 @@ class PatchService:
         self.run_dir = run_dir
         self.sonnet_provider = self._create_sonnet_provider(run_dir)
         self.haiku_prompt = self.load_prompt("haiku_prompt.txt")
-        self.sonnet_prompt = self.load_prompt("haiku_prompt.txt")
+        self.sonnet_prompt = self.load_prompt("sonnet_prompt.txt")
+        if PATCH_OUTPUT_MODE not in OUTPUT_MODES:
+            raise ValueError(f"Invalid PATCH_OUTPUT_MODE: {PATCH_OUTPUT_MODE}. Expected one of {', '.join(OUTPUT_MODES)}")
+        self.hunk_prompt = self.load_prompt("hunk_patch_prompt.txt") if PATCH_OUTPUT_MODE == "hunks" else None
+        self.hunk_engine = LocalPatchEngine()
         self.anthropic_client = anthropic.Client(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+        self.routes = {
+            HAIKU: (self.haiku_provider, self.haiku_prompt, "Haiku"),
+            SONNET: (self.sonnet_provider, self.sonnet_prompt, "Sonnet"),
+        }
+        self.router = ModelRouter({route: provider.model for route, (provider, _, _) in self.routes.items()})
+        self.local_engine = LocalPatchEngine() if PATCH_LOCAL_ENGINE else None
+        prompts = {route: prompt for route, (_, prompt, _) in self.routes.items()}
+        if self.hunk_prompt:
+            prompts["hunks"] = self.hunk_prompt
+        self.patch_cache = PatchCache(
+            {route: provider.model for route, (provider, _, _) in self.routes.items()}, prompts,
+        ) if PATCH_CACHE else None
 
     def load_prompt(self, prompt_filename):
         try: 
@@ -36,22 +71,175 @@ class PatchService:
         return self.anthropic_client.count_tokens(text)
 
     def apply_patch(self, original_content, patch_content, file_path):
+        return self.apply_patch_with_strategy(original_content, patch_content, file_path)[0]
+
+    def apply_patch_with_strategy(self, original_content, patch_content, file_path):
+        """
+        Returns the updated content and how it was produced: the local match strategy
+        (strict, whitespace or fuzzy) or llm:<model> when the patch had to go to an LLM.
+        """
+        if self.local_engine:
+            try:
+                result = self.local_engine.apply(original_content, patch_content)
+                self._validate(original_content, result.content, patch_content, file_path)
+                self.logger.info(f"Applied patch to {file_path} locally ({result.strategy} match, {len(result.hunks)} hunks)")
+                return result.content, result.strategy
+            except (LocalPatchError, InvalidPatchOutputError) as e:
+                self.logger.info(f"Could not apply patch to {file_path} locally ({str(e)}). Falling back to LLM.")
+        return self._apply_patch_with_llm(original_content, patch_content, file_path)
+
+    def apply_patches_with_strategy(self, original_content, patch_contents, file_path):
+        """
+        Apply every patch for one file in a single pass: locally when possible, otherwise in one LLM call.
+        Raises PatchConflictError when the patches change overlapping lines.
+        """
+        if len(patch_contents) == 1:
+            return self.apply_patch_with_strategy(original_content, patch_contents[0], file_path)
+        if self.local_engine:
+            try:
+                result = self.local_engine.apply_many(original_content, patch_contents)
+                self._validate(original_content, result.content, "\n\n".join(patch_contents), file_path)
+                self.logger.info(f"Applied {len(patch_contents)} patches to {file_path} locally ({result.strategy} match)")
+                return result.content, result.strategy
+            except PatchConflictError:
+                raise
+            except (LocalPatchError, InvalidPatchOutputError) as e:
+                self.logger.info(f"Could not apply the {len(patch_contents)} patches to {file_path} against the original file ({str(e)}).")
+            try:
+                # Later patches may have been written against the result of the earlier ones
+                content, strategies = original_content, []
+                for patch_content in patch_contents:
+                    result = self.local_engine.apply(content, patch_content)
+                    content = result.content
+                    strategies.extend(result.hunks)
+                self._validate(original_content, content, "\n\n".join(patch_contents), file_path)
+                self.logger.info(f"Applied {len(patch_contents)} patches to {file_path} locally, one after the other")
+                return content, self.local_engine.weakest_strategy(strategies)
+            except (LocalPatchError, InvalidPatchOutputError) as e:
+                self.logger.info(f"Could not apply the {len(patch_contents)} patches to {file_path} locally ({str(e)}). Falling back to LLM.")
+        return self._apply_patch_with_llm(original_content, "\n\n".join(patch_contents), file_path)
+
+    def _apply_patch_with_llm(self, original_content, patch_content, file_path):
+        if self.patch_cache:
+            cached = self.patch_cache.get(original_content, patch_content)
+            if cached:
+                self.logger.info(f"Reusing cached result for this patch to {file_path}")
+                return cached[0], f"cache:{cached[1]}"
+
         token_count = self._check_token_count(original_content)
-        
-        if token_count <= HAIKU_TOKEN_LIMIT:
-            return self._apply_patch_with_model(original_content, patch_content, file_path, self.haiku_provider, self.haiku_prompt, "Haiku")
-        elif token_count <= SONNET_TOKEN_LIMIT:
-            self.logger.info(f"File {file_path} exceeds Haiku token limit. Using Claude Sonnet.")
-            return self._apply_patch_with_model(original_content, patch_content, file_path, self.sonnet_provider, self.sonnet_prompt, "Sonnet")
+        if token_count > SONNET_TOKEN_LIMIT:
+            updated_content, strategy = self._apply_patch_in_window(original_content, patch_content, file_path, token_count)
         else:
-            raise ValueError(f"Input file is too big even for Sonnet. Token count: {token_count}, limit: {SONNET_TOKEN_LIMIT}")
+            updated_content, strategy = self._apply_patch_with_routes(
+                original_content, patch_content, file_path, token_count,
+                validate=lambda updated: self._validate(original_content, updated, patch_content, file_path))
+        if self.patch_cache:
+            self.patch_cache.put(original_content, patch_content, updated_content, strategy)
+        return updated_content, strategy
+
+    def _apply_patch_with_routes(self, original_content, patch_content, file_path, token_count, validate=None):
+        features = compute_patch_features(patch_content, file_path, token_count)
+        route = self.router.route(features)
+
+        attempts = [(route_name, "file", None) for route_name in route]
+        if self.hunk_prompt:
+            attempts = [(route_name, "hunks", None) for route_name in route] + [(route[-1], "file", None)]
+        validation_retries = PATCH_VALIDATION_RETRIES
+
+        index = 0
+        while index < len(attempts):
+            route_name, output_mode, feedback = attempts[index]
+            index += 1
+            provider, prompt_template, model_name = self.routes[route_name]
+            # The feedback goes after the cached prefix (instructions and original file), which stays reusable
+            attempt_patch = patch_content + feedback if feedback else patch_content
+            start = time.monotonic()
+            try:
+                if output_mode == "hunks":
+                    updated_content = self._apply_patch_with_model_hunks(original_content, attempt_patch, file_path, provider, model_name)
+                else:
+                    updated_content = self._apply_patch_with_model(original_content, attempt_patch, file_path, provider, prompt_template, model_name)
+                if validate:
+                    validate(updated_content)
+            except MalformedPatchOutputError as e:
+                self.router.record(route_name, features, success=False, latency_seconds=time.monotonic() - start)
+                if isinstance(e, InvalidPatchOutputError) and validation_retries > 0:
+                    validation_retries -= 1
+                    feedback = (f"\n\nA previous attempt at this patch was rejected: {str(e)}. "
+                                f"Apply the patch again and make sure the result does not have this problem.")
+                    attempts.insert(index, (route_name, output_mode, feedback))
+                if index == len(attempts):
+                    raise
+                next_route, next_mode, _ = attempts[index]
+                self.logger.warning(f"{model_name} returned malformed output for {file_path} ({str(e)}). "
+                                    f"Retrying with {self.routes[next_route][2]} ({'edits' if next_mode == 'hunks' else 'full file'}).")
+                continue
+            self.router.record(route_name, features, success=True, latency_seconds=time.monotonic() - start)
+            return updated_content, f"llm:{route_name}" + (":hunks" if output_mode == "hunks" else "")
+
+    def _apply_patch_in_window(self, original_content, patch_content, file_path, token_count):
+        """
+        Send only the region the patch touches (plus margins) to the LLM and splice the result back,
+        so large files cost as much as the patch rather than the whole file.
+        """
+        window = find_patch_window(original_content, patch_content, file_path)
+        if window is None:
+            raise ValueError(f"Input file is too big even for Sonnet and the patch could not be located in it. Token count: {token_count}, limit: {SONNET_TOKEN_LIMIT}")
+        start, end = window
+        lines = original_content.split('\n')
+        excerpt = '\n'.join(lines[start:end])
+        self.logger.info(f"{file_path} has {token_count} tokens, patching lines {start + 1}-{end} only")
+
+        def validate(updated_excerpt):
+            # The margins are outside the patch, so a model that lost or rewrote them did not return the whole excerpt
+            updated_lines = updated_excerpt.split('\n')
+            if start > 0 and updated_lines[0].rstrip() != lines[start].rstrip():
+                raise MalformedPatchOutputError("LLM response does not start with the first line of the excerpt")
+            if end < len(lines) and updated_lines[-1].rstrip() != lines[end - 1].rstrip():
+                raise MalformedPatchOutputError("LLM response does not end with the last line of the excerpt")
+            self._validate(original_content, '\n'.join(lines[:start] + updated_lines + lines[end:]), patch_content, file_path)
+
+        note = (f"\n\nThe original file above is an excerpt of {file_path} (lines {start + 1}-{end}). "
+                f"Treat the excerpt as the whole file.")
+        updated_excerpt, strategy = self._apply_patch_with_routes(
+            excerpt, patch_content + note, file_path, self._check_token_count(excerpt), validate=validate)
+        return '\n'.join(lines[:start] + updated_excerpt.split('\n') + lines[end:]), f"{strategy}:window"
+
+    def _validate(self, original_content, updated_content, patch_content, file_path):
+        if PATCH_VALIDATION:
+            validate_patched_output(original_content, updated_content, patch_content, file_path)
+
+    def _apply_patch_with_model_hunks(self, original_content, patch_content, file_path, provider, model_name):
+        self.logger.info(f"Asking {model_name} for the edits to {file_path}")
+        messages = self._build_patch_messages(self.hunk_prompt, original_content, patch_content)
+        with llm_stage("patching"):
+            response = provider.generate_response(messages)
+        self._store_llm_response(file_path, response, f"{model_name}.hunks")
+
+        edits = self._strip_wrapper_fence(response)
+        try:
+            result = self.hunk_engine.apply(original_content, edits)
+        except LocalPatchError as e:
+            raise MalformedPatchOutputError(f"{model_name} edits could not be applied: {str(e)}")
+        self.logger.info(f"Applied {len(result.hunks)} edits from {model_name} to {file_path} ({result.strategy} match)")
+        return result.content
+
+    @staticmethod
+    def _strip_wrapper_fence(response):
+        # Only the fence around all the edits goes; fences inside SEARCH/REPLACE blocks belong to the file
+        lines = response.split('\n')
+        markers = [i for i, line in enumerate(lines) if line.startswith(('<<<<<<<', '>>>>>>>'))]
+        fences = [i for i, line in enumerate(lines) if line.strip().startswith('```')]
+        if markers and fences and fences[0] < markers[0] and fences[-1] > markers[-1]:
+            return '\n'.join(lines[fences[0] + 1:fences[-1]])
+        return response
 
     def _apply_patch_with_model(self, original_content, patch_content, file_path, provider, prompt_template, model_name):
         self.logger.info(f"Applying patch to {file_path} using {model_name}")
-        prompt = prompt_template.format(original_content=original_content, patch_content=patch_content)
         self.logger.info(f"Sending prompt to {model_name} LLM provider")
-        messages = [{"role": "user", "content": prompt}]
-        response = provider.generate_response(messages)
+        messages = self._build_patch_messages(prompt_template, original_content, patch_content)
+        with llm_stage("patching"):
+            response = provider.generate_response(messages)
         self._store_llm_response(file_path, response, model_name)
         
         lines = response.split('\n')
@@ -63,11 +251,23 @@ class PatchService:
             
             if end_index != -1:
                 updated_content = '\n'.join(content_lines[:-end_index-1])
+                if original_content.strip() and not updated_content.strip():
+                    raise MalformedPatchOutputError("LLM response contains an empty file")
                 return updated_content
         
         error_msg = "LLM response does not contain properly formatted updated content"
         self.logger.error(error_msg)
-        raise ValueError(error_msg)
+        raise MalformedPatchOutputError(error_msg)
+
+    def _build_patch_messages(self, prompt_template, original_content, patch_content):
+        # Instructions and the original file come first and are marked for prompt caching,
+        # so several patches, retries or escalations on the same file reuse that prefix.
+        shared_template, _, patch_template = prompt_template.partition("{patch_content}")
+        content = [
+            cacheable_text(shared_template.format(original_content=original_content)),
+            {"type": "text", "text": patch_content + patch_template},
+        ]
+        return [{"role": "user", "content": content}]
 
     def _store_llm_response(self, file_path, response, model_name):
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
@@ -0,0 +1,77 @@
+import os
+import ast
+from typing import List, Optional, Tuple
+from .local_patch_engine import LocalPatchEngine, parse_patch, _normalize
+from .exceptions import LocalPatchError
+
+WINDOW_MARGIN_LINES = int(os.getenv("PATCH_WINDOW_MARGIN_LINES", 20))
+MIN_ANCHOR_CHARS = 8
+ANCHOR_FUZZY_THRESHOLD = 0.6
+
+
+def _hunk_anchors(lines: List[str], patch_content: str) -> Optional[List[int]]:
+    """Line indexes of the file that the patch's hunks refer to, or None when some hunk cannot be located."""
+    try:
+        hunks = parse_patch(patch_content)
+    except LocalPatchError:
+        return None
+    engine = LocalPatchEngine(fuzzy_threshold=ANCHOR_FUZZY_THRESHOLD)
+    normalized = [_normalize(line) for line in lines]
+    anchors = []
+    for hunk in hunks:
+        located = engine._locate_hunk(lines, hunk, 0) if hunk.old_lines else None
+        if located is not None:
+            anchors.extend([located.start, max(located.start, located.end - 1)])
+            continue
+        # Fall back to the hunk's distinctive lines that appear exactly once in the file
+        hunk_anchors = []
+        for old_line in hunk.old_lines:
+            target = _normalize(old_line)
+            if len(target) >= MIN_ANCHOR_CHARS and normalized.count(target) == 1:
+                hunk_anchors.append(normalized.index(target))
+        if hunk.old_start and not hunk_anchors:
+            hunk_anchors.append(min(hunk.old_start - 1, len(lines) - 1))
+        if not hunk_anchors:
+            # A window without this hunk's lines could not be patched
+            return None
+        anchors.extend(hunk_anchors)
+    return anchors
+
+
+def _enclosing_definition(tree: ast.AST, line_number: int) -> Optional[Tuple[int, int]]:
+    """Smallest function or class containing the 1-based line, as a 0-based [start, end) span including decorators."""
+    best = None
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+        if start <= line_number <= node.end_lineno and (best is None or node.end_lineno - start < best[1] - best[0]):
+            best = (start - 1, node.end_lineno)
+    return best
+
+
+def find_patch_window(original_content: str, patch_content: str, file_path: str,
+                      margin: int = WINDOW_MARGIN_LINES) -> Optional[Tuple[int, int]]:
+    """
+    The 0-based [start, end) line span of the file a patch needs: the lines its hunks anchor to,
+    widened to the enclosing functions or classes for Python files, plus `margin` lines on each side.
+    Returns None when any hunk of the patch cannot be located.
+    """
+    lines = original_content.split('\n')
+    anchors = _hunk_anchors(lines, patch_content)
+    if not anchors:
+        return None
+    start, end = min(anchors), max(anchors) + 1
+
+    if file_path.endswith('.py'):
+        try:
+            tree = ast.parse(original_content)
+        except SyntaxError:
+            tree = None
+        if tree is not None:
+            for anchor in (start, end - 1):
+                definition = _enclosing_definition(tree, anchor + 1)
+                if definition:
+                    start, end = min(start, definition[0]), max(end, definition[1])
+
+    return max(0, start - margin), min(len(lines), end + margin)
@@ -1,7 +1,7 @@
 import os
 import sys
 from dotenv import load_dotenv
-from ..llm_providers import get_provider
+from ..llm_providers import get_provider, llm_stage
 from ..shared_utils.logger import setup_logger
 from ..shared_utils.file_utils import empty_file, get_app_root
 from ..shared_utils.test_runner.test_utils import is_running_tests
@@ -36,7 +36,8 @@ class PromptPostProcessor:
             messages = [
                 {"role": "user", "content": f"{self.post_processing_prompt}\n\n{original_prompt}"}
             ]
-            post_processed_prompt = self.haiku_provider.generate_response(messages)
+            with llm_stage("post_processing"):
+                post_processed_prompt = self.haiku_provider.generate_response(messages)
             post_processed_file = os.path.join(run_dir, "post_processed_prompt.md")
             with open(post_processed_file, 'w') as f:
                 f.write(post_processed_prompt)
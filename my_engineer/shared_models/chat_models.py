@@ -35,6 +35,9 @@ class ConversationState(BaseModel):
     previous_run: Optional[str] = None
     context: Optional[str] = None
     smart_context_added: bool = False
+    # Earlier messages (after the initial context) sent compacted, and the oldest ones left out, see ConversationWindow
+    compacted_message_count: int = Field(default=0, ge=0)
+    dropped_message_count: int = Field(default=0, ge=0)
 
     @classmethod
     def from_dict(cls, data: Dict):
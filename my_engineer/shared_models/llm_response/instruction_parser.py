@@ -1,44 +1,191 @@
 import re
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Union
+from ...shared_utils.logger import setup_logger
+
+Instruction = Tuple[str, str, List[str]]
+
+COMMIT_PATTERN = re.compile(r'###COMMIT\s*:?\s*(.+)')
+HEADER_PATTERN = re.compile(r'^\s*###\s*(PATCH|NEW|BASH)\s*:\s*(\S+)(.*)$', re.IGNORECASE)
+FENCE_PATTERN = re.compile(r'^(\s*)(`{3,})(.*)$')
+
+OUTSIDE, AFTER_HEADER, IN_BLOCK = "outside", "after_header", "in_block"
+
 
 class InstructionParser:
-    @staticmethod
-    def extract_instructions(text: str) -> Tuple[List[Tuple[str, str, List[str]]], Optional[str], Optional[str], Optional[str]]:
-        instructions = []
-        preamble = []
-        postamble = []
-        commit_name = None
-
-        # Regular expression for commit name
-        commit_pattern = r'###COMMIT\s*:?\s*(.+)'
-        commit_match = re.search(commit_pattern, text)
-        if commit_match:
-            commit_name = commit_match.group(1).strip()
-
-        # Regular expression for file actions and code blocks
-        block_pattern = r'###(\w+):\s*(\S+)\s*```(?:.*?)\n(.*?)```'
-        
-        # Find all blocks
-        block_matches = list(re.finditer(block_pattern, text, re.DOTALL))
-        
-        if not block_matches:
-            # If no blocks found, treat the entire input as preamble
-            return [], text.strip(), None, commit_name
+    """
+    Line-oriented state machine that extracts ###PATCH / ###NEW / ###BASH blocks.
+
+    Text can be fed in chunks of any size (feed, then close) and each instruction is returned
+    as soon as its closing fence has been read, so parsing is linear in the response size.
+    Inside a block, a fence with a language (```python) opens a nested block and a bare fence
+    closes the innermost one; diff lines of a PATCH block are never taken as fences, but an
+    indented bare fence there may be a sloppy close (see below). A block
+    opened with a longer fence (````) is closed by a fence as long, whatever it contains; if it
+    is closed with a shorter one, it ends at that fence when the next instruction starts or the
+    response ends.
+    """
+
+    def __init__(self):
+        self.instructions: List[Instruction] = []
+        self.commit_name: Optional[str] = None
+        self._partial: List[str] = []
+        self._state = OUTSIDE
+        self._preamble: List[str] = []
+        self._postamble: List[str] = []
+        self._seen_header = False
+        self._header: Optional[Tuple[str, str]] = None
+        self._header_line = ""
+        self._block: List[str] = []
+        self._fence_length = 0
+        self._depth = 0
+        self._close_candidate: Optional[int] = None
+        self.logger = setup_logger("InstructionParser")
+
+    @property
+    def preamble(self) -> Optional[str]:
+        return '\n'.join(self._preamble).strip() or None
+
+    @property
+    def postamble(self) -> Optional[str]:
+        return '\n'.join(self._postamble).strip() or None
 
-        # Process preamble (content before the first block)
-        if block_matches[0].start() > 0:
-            preamble = text[:block_matches[0].start()].strip()
+    def feed(self, text: str) -> List[Instruction]:
+        """Consume a chunk of the response. Returns the instructions completed by it."""
+        completed = []
+        if '\n' not in text:
+            self._partial.append(text)
+            return completed
+        lines = (''.join(self._partial) + text).split('\n')
+        self._partial = [lines.pop()]
+        for line in lines:
+            instruction = self._feed_line(line)
+            if instruction:
+                completed.append(instruction)
+        return completed
 
-        # Process blocks
-        for match in block_matches:
-            action, path, content = match.groups()
-            instructions.append((action.lower(), path, InstructionParser._process_content(content)))
+    def close(self) -> List[Instruction]:
+        """Consume the rest of the response. Returns the instructions completed by it."""
+        completed = []
+        partial = ''.join(self._partial)
+        self._partial = []
+        if partial:
+            instruction = self._feed_line(partial)
+            if instruction:
+                completed.append(instruction)
+        if self._state == IN_BLOCK and self._close_candidate is not None:
+            completed.append(self._finish_block(self._close_candidate))
+        elif self._state == AFTER_HEADER:
+            self._outside_text(self._header_line)
+        elif self._state == IN_BLOCK:
+            # A block without a closing fence is dropped: the response was most likely cut off
+            action, path = self._header
+            self.logger.warning(f"Dropped the {action.upper()} block for {path}: it has no closing fence")
+        self._state = OUTSIDE
+        return completed
 
-        # Process postamble (content after the last block)
-        if block_matches[-1].end() < len(text):
-            postamble = text[block_matches[-1].end():].strip()
+    def _outside_text(self, line: str) -> None:
+        if self.commit_name is None and '###' in line:
+            match = COMMIT_PATTERN.search(line)
+            if match:
+                self.commit_name = match.group(1).strip()
+        (self._postamble if self._seen_header else self._preamble).append(line)
 
-        return instructions, preamble or None, postamble or None, commit_name
+    def _start_header(self, match: re.Match, line: str) -> Optional[Instruction]:
+        self._seen_header = True
+        self._postamble = []
+        self._header = (match.group(1).lower(), match.group(2))
+        self._header_line = line
+        self._state = AFTER_HEADER
+        fence = FENCE_PATTERN.match(match.group(3).strip())
+        if fence:
+            self._open_block(fence)
+        return None
+
+    def _open_block(self, fence: re.Match) -> None:
+        self._state = IN_BLOCK
+        self._block = []
+        self._fence_length = len(fence.group(2))
+        self._depth = 0
+        self._close_candidate = None
+
+    def _finish_block(self, end: int) -> Instruction:
+        action, path = self._header
+        instruction = (action, path, self._process_content('\n'.join(self._block[:end])))
+        self.instructions.append(instruction)
+        self._state = OUTSIDE
+        trailing, self._block = self._block[end + 1:], []
+        # Closed at an earlier candidate fence: what followed it was plain text
+        for line in trailing:
+            self._outside_text(line)
+        return instruction
+
+    def _feed_line(self, line: str) -> Optional[Instruction]:
+        if line.endswith('\r'):
+            line = line[:-1]
+        if self._state == IN_BLOCK and '`' not in line and '###' not in line:
+            # Fast path for the bulk of a response: plain content lines
+            self._block.append(line)
+            return None
+        if self._state == OUTSIDE:
+            header = HEADER_PATTERN.match(line) if '###' in line else None
+            if header:
+                return self._start_header(header, line)
+            self._outside_text(line)
+            return None
+
+        if self._state == AFTER_HEADER:
+            header = HEADER_PATTERN.match(line)
+            if header:
+                self._outside_text(self._header_line)
+                return self._start_header(header, line)
+            fence = FENCE_PATTERN.match(line)
+            if fence:
+                self._open_block(fence)
+            elif line.strip():
+                # The header was not followed by a code block: it was plain text
+                self._outside_text(self._header_line)
+                self._outside_text(line)
+                self._state = OUTSIDE
+            return None
+
+        header = HEADER_PATTERN.match(line) if '###' in line else None
+        if header and self._depth == 0 and self._close_candidate is not None:
+            instruction = self._finish_block(self._close_candidate)
+            self._start_header(header, line)
+            return instruction
+
+        fence = FENCE_PATTERN.match(line)
+        if fence and self._header[0] == 'patch' and (fence.group(1) or line[:1] in ('+', '-')):
+            if fence.group(1) and not fence.group(3).strip() and self._depth == 0:
+                # An indented bare fence is a context line or a sloppy close, known once the block ends
+                self._close_candidate = len(self._block)
+            fence = None  # Diff lines of a patch are content, even when they contain backticks
+        if fence:
+            info = fence.group(3).strip()
+            if info and '`' not in info:
+                self._depth += 1
+            elif len(fence.group(2)) >= self._fence_length and (self._depth == 0 or self._fence_length > 3):
+                # A longer opening fence can only be closed by one as long, so nested blocks cannot hide it
+                return self._finish_block(len(self._block))
+            elif self._depth > 0:
+                self._depth -= 1
+            else:
+                # Shorter than the opening fence: a nested block or a sloppy close, known once the block ends
+                self._close_candidate = len(self._block)
+        self._block.append(line)
+        return None
+
+    @staticmethod
+    def extract_instructions(text: Union[str, List[str]]) -> Tuple[List[Instruction], Optional[str], Optional[str], Optional[str]]:
+        if isinstance(text, list):
+            text = '\n'.join(text)
+        parser = InstructionParser()
+        parser.feed(text)
+        parser.close()
+        if not parser.instructions:
+            # If no blocks found, treat the entire input as preamble
+            return [], text.strip(), None, parser.commit_name
+        return parser.instructions, parser.preamble, parser.postamble, parser.commit_name
 
     @staticmethod
     def _process_content(content: str) -> List[str]:
@@ -57,4 +204,4 @@ class InstructionParser:
             lines = lines[1:]
         if lines and lines[-1].strip() == '```':
             lines = lines[:-1]
-        return '\n'.join(lines).strip()
\ No newline at end of file
+        return '\n'.join(lines).strip()
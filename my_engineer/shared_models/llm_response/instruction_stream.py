@@ -0,0 +1,39 @@
+from typing import Callable, List, Optional, Union
+from .llm_response_models import PatchInstruction, NewFileInstruction, BashScriptInstruction
+from .instruction_parser import InstructionParser
+from .instruction_processor import InstructionProcessor
+
+Instruction = Union[PatchInstruction, NewFileInstruction, BashScriptInstruction]
+
+
+class InstructionStream:
+    """
+    Detects completed ###PATCH / ###NEW / ###BASH blocks in text that arrives in chunks.
+
+    Each block is handed to `on_instruction` as soon as its closing fence has been received,
+    so downstream work can start while the rest of the response is still being generated.
+    """
+
+    def __init__(self, on_instruction: Optional[Callable[[Instruction], None]] = None):
+        self.on_instruction = on_instruction
+        self.instructions: List[Instruction] = []
+        self._parser = InstructionParser()
+
+    def feed(self, text: str) -> None:
+        self._emit(self._parser.feed(text))
+
+    def close(self) -> None:
+        self._emit(self._parser.close())
+
+    @property
+    def instruction_count(self) -> int:
+        return len(self.instructions)
+
+    def _emit(self, parsed) -> None:
+        if not parsed:
+            return
+        patches, new_files, bash_scripts = InstructionProcessor.process_instructions(parsed)
+        for instruction in patches + new_files + bash_scripts:
+            self.instructions.append(instruction)
+            if self.on_instruction:
+                self.on_instruction(instruction)
@@ -13,16 +13,14 @@ class LLMResponseHandler:
     @staticmethod
     def _parse_instructions(response: LLMResponse):
         full_text = LLMResponseHandler._get_full_text(response)
-        lines = full_text.split('\n')
-        for i, line in enumerate(lines):
-            lines[i] = line.rstrip()  # Remove trailing whitespace
-        instructions, preamble, postamble, commit_name = InstructionParser.extract_instructions(lines)
+        text = '\n'.join(line.rstrip() for line in full_text.split('\n'))  # Remove trailing whitespace
+        instructions, preamble, postamble, commit_name = InstructionParser.extract_instructions(text)
         patches, new_files, bash_scripts = InstructionProcessor.process_instructions(instructions)
         response.patches = patches
         response.new_files = new_files
         response.bash_scripts = bash_scripts
-        response.preamble_instructions = '\n'.join(preamble).strip() if preamble else None
-        response.postamble_instructions = '\n'.join(postamble).strip() if postamble else None
+        response.preamble_instructions = preamble
+        response.postamble_instructions = postamble
         response.commit_name = commit_name
 
     @staticmethod
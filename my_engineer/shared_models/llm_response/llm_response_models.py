@@ -9,6 +9,7 @@ class PatchInstruction(BaseModel):
     file_path: str
     patch_content: str
     processed_patch_path: Optional[str] = None
+    apply_strategy: Optional[str] = None  # strict, whitespace, fuzzy or llm:<model>
 
 class NewFileInstruction(BaseModel):
     file_path: str
@@ -5,4 +5,6 @@ from .file_utils import empty_file
 from .git_utils import check_uncommitted_changes
 from .pipeline_helpers import append_test_results_to_next_prompt
 from .test_runner.test_utils import is_running_tests
-__all__ = ['ErrorHandler', 'setup_logger', 'get_user_approval', 'empty_file', 'check_uncommitted_changes', 'pipeline_helpers', 'is_running_tests']
\ No newline at end of file
+from .workspace_transaction import WorkspaceTransaction, rollback_journal
+from .workspace_overlay import WorkspaceOverlay
+__all__ = ['ErrorHandler', 'setup_logger', 'get_user_approval', 'empty_file', 'check_uncommitted_changes', 'pipeline_helpers', 'is_running_tests', 'WorkspaceTransaction', 'rollback_journal', 'WorkspaceOverlay']
\ No newline at end of file
@@ -5,6 +5,7 @@ class Config:
         self._config: Dict[str, Any] = {
             'editor': 'vscode',  # Default to VS Code
             'use_cursor': False,
+            'stream_responses': False,
             # Add other configuration options here
         }
 
@@ -18,6 +19,10 @@ class Config:
     def use_cursor(self) -> bool:
         return self.get('use_cursor', False)
 
+    @property
+    def stream_responses(self) -> bool:
+        return self.get('stream_responses', False)
+
     @property
     def editor(self) -> str:
         return self.get('editor', 'vscode')
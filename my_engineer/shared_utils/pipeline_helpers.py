@@ -149,14 +149,14 @@ def create_git_branch(commit_name: str, run_dir: str):
         logger.error(f"Traceback: {traceback.format_exc()}")
         raise
 
-def generate_instructions(prompt_content: str, llm_prompter, run_dir: str, conversation_state: ConversationState) -> Dict:
+def generate_instructions(prompt_content: str, llm_prompter, run_dir: str, conversation_state: ConversationState, on_instruction=None) -> Dict:
     logger.info("Generating instructions")
     logger.debug(f"Prompt content: {prompt_content[:100]}...")
     logger.debug(f"Smart context: {conversation_state.context[:100] if conversation_state.context else 'Not available'}...")
     logger.info(f"Generate instructions run_dir: {run_dir}")
     logger.info(f"Generate instructions conversation_state.previous_run: {conversation_state.previous_run}")
 
-    raw_instructions = llm_prompter.generate_instructions(conversation_state, prompt_content)
+    raw_instructions = llm_prompter.generate_instructions(conversation_state, prompt_content, on_instruction)
     run_dir_context = {
         'raw_instructions': raw_instructions,
         'run_dir': run_dir
@@ -209,17 +209,17 @@ def process_instructions(run_dir_context: Dict, instruction_processor) -> Dict:
     logger.info(f"Saved processed instructions to {processed_instructions_path}")
     return run_dir_context
 
-def process_patches(run_dir_context: Dict, patch_processor) -> Dict:
+def process_patches(run_dir_context: Dict, patch_processor, workspace=None) -> Dict:
     project_root = os.getcwd()
     logger.info(f"Processing patches with project root: {project_root}")
-    patch_processor.process_patches(run_dir_context['llm_response'].patches, project_root)
+    patch_processor.process_patches(run_dir_context['llm_response'].patches, project_root, workspace)
     return run_dir_context
 
-def perform_file_operations(run_dir_context: Dict, file_operator) -> Dict:
+def perform_file_operations(run_dir_context: Dict, file_operator, workspace=None) -> Dict:
     logger.info("Performing file operations")
     project_root = os.getcwd()
-    file_operator.create_new_files(run_dir_context['llm_response'].new_files, project_root)
-    file_operator.save_bash_scripts(run_dir_context['llm_response'].bash_scripts, project_root)
+    file_operator.create_new_files(run_dir_context['llm_response'].new_files, project_root, workspace)
+    file_operator.save_bash_scripts(run_dir_context['llm_response'].bash_scripts, project_root, workspace)
     return run_dir_context
 
 def resume_from_file(resume_file: str, run_dir: str) -> Dict:
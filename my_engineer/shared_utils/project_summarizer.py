@@ -3,6 +3,7 @@ import yaml
 from typing import Dict, List
 from ..shared_utils.file_utils import get_git_tracked_files
 from ..shared_utils.logger import setup_logger
+from ..llm_providers import run_concurrently, llm_stage
 
 class ProjectSummarizer:
     def __init__(self, root_dir: str, haiku_provider):
@@ -27,11 +28,12 @@ class ProjectSummarizer:
         existing_files = set(self.summaries.keys())
         current_files = set(get_git_tracked_files(self.root_dir))
 
-        new_files = current_files - existing_files
+        new_files = sorted(current_files - existing_files)
         removed_files = existing_files - current_files
 
-        for file in new_files:
-            summary = self._generate_summary(file)
+        with llm_stage("summaries"):
+            summaries = run_concurrently(self._generate_summary(file) for file in new_files)
+        for file, summary in zip(new_files, summaries):
             if summary:
                 self.logger.info(f"Generated summary for new file: {file}")
                 self.summaries[file] = self.sanitize_for_yaml(summary)
@@ -45,12 +47,12 @@ class ProjectSummarizer:
         self.logger.info(f"Added summaries for {len(new_files)} new files.")
         self.logger.info(f"Removed summaries for {len(removed_files)} deleted files.")
 
-    def _generate_summary(self, file_path: str) -> str:
+    async def _generate_summary(self, file_path: str) -> str:
         try:
             with open(file_path, 'r') as file:
                 content = file.read(20000)  # Read first 20,000 characters
             prompt = f"Summarize what this file does in 5 lines or less, list internal dependencies: {file_path}\n\nContent:\n{content}"
-            summary = self.haiku_provider.generate_response([{"role": "user", "content": prompt}])
+            summary = await self.haiku_provider.generate_response_async([{"role": "user", "content": prompt}])
             self.logger.debug(f"Generated summary for {file_path}: {summary[:50]}...")
             return summary.strip()
         except Exception as e:
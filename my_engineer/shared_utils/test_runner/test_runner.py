@@ -1,18 +1,27 @@
 import subprocess
 import os
+import shlex
 from ...shared_utils.logger import setup_logger
-from typing import Optional
+from typing import List, Optional
 import logging
 import json
 
-def run_unit_tests() -> str:
+def run_unit_tests(project_dir: Optional[str] = None, test_paths: Optional[List[str]] = None,
+                   coverage_rcfile: Optional[str] = None) -> str:
     """
-    Run pytest for unit tests from the current working directory and return the results as a string.
+    Run pytest for unit tests from the current working directory, or from project_dir (e.g. a
+    materialized workspace overlay) with the current directory's virtual environment, and return
+    the results as a string. test_paths limits the run to those test files; coverage_rcfile runs
+    pytest under coverage with that configuration.
+
+    The code under test is imported from project_dir first (its root and its src/ directory), so
+    an editable install of the project in the virtual environment does not point the tests back at
+    the live tree. Packages laid out elsewhere still resolve through the virtual environment.
     """
     try:
         output = ""
-        current_dir = os.getcwd()
-        venv_activate = os.path.join(current_dir, '.venv', 'bin', 'activate')
+        venv_activate = os.path.join(os.getcwd(), '.venv', 'bin', 'activate')
+        current_dir = project_dir or os.getcwd()
         pytest_ini_path = os.path.join(current_dir, 'pytest.ini')
         
         if not os.path.exists(venv_activate):
@@ -23,12 +32,22 @@ def run_unit_tests() -> str:
             return "Tests skipped: pytest.ini not found."
         
         logger.info(f"Running pytest in directory: {current_dir}")
-        command = f"source {venv_activate} && pytest --disable-warnings"
+        pytest_command = f"coverage run --rcfile={shlex.quote(coverage_rcfile)} -m pytest" if coverage_rcfile else "python -m pytest"
+        command = f"source {venv_activate} && {pytest_command} --disable-warnings"
+        if test_paths:
+            command += " " + " ".join(shlex.quote(path) for path in test_paths)
+        env = os.environ.copy()
+        if project_dir:
+            import_paths = [project_dir]
+            if os.path.isdir(os.path.join(project_dir, 'src')):
+                import_paths.append(os.path.join(project_dir, 'src'))
+            env["PYTHONPATH"] = os.pathsep.join(import_paths + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else []))
         result = subprocess.run(
             command,
             shell=True,
             executable='/bin/bash',
             cwd=current_dir,
+            env=env,
             capture_output=True,
             text=True,
             check=False  # Don't raise an exception for test failures
@@ -47,6 +66,18 @@ def run_unit_tests() -> str:
         logger.error(f"Unexpected error running pytest: {str(e)}")
         return f"Unexpected error running pytest: {str(e)}"
 
+def export_coverage_json(project_dir: Optional[str], coverage_rcfile: str, output_path: str) -> bool:
+    """Write the coverage data of the last run_unit_tests(coverage_rcfile=...) as JSON, with the test contexts of each line."""
+    venv_activate = os.path.join(os.getcwd(), '.venv', 'bin', 'activate')
+    command = (f"source {venv_activate} && coverage json --rcfile={shlex.quote(coverage_rcfile)} "
+               f"--show-contexts -o {shlex.quote(output_path)}")
+    result = subprocess.run(command, shell=True, executable='/bin/bash', cwd=project_dir or os.getcwd(),
+                            capture_output=True, text=True, check=False)
+    if result.returncode != 0:
+        logger.warning(f"Could not export coverage data: {(result.stdout + result.stderr).strip()}")
+        return False
+    return True
+
 def check_test_results(output: str) -> bool:
     """
     Check if all tests passed based on pytest output.
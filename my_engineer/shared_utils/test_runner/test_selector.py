@@ -0,0 +1,290 @@
+import os
+import ast
+import json
+import fnmatch
+import hashlib
+import tempfile
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set
+from ...shared_utils.logger import setup_logger
+from .test_runner import run_unit_tests, export_coverage_json
+
+# Set to 1 to run only the tests that depend on the files a turn changed instead of the whole suite
+TEST_SELECTION = os.getenv("TEST_SELECTION", "0").lower() in ("1", "true", "on")
+# Every Nth test run is a full run, to catch what the selection misses (0 to never escalate on a schedule)
+TEST_SELECTION_FULL_EVERY = int(os.getenv("TEST_SELECTION_FULL_EVERY", 5))
+# Set to 1 to record per-test coverage on full runs (needs coverage installed in the project's .venv)
+TEST_SELECTION_COVERAGE = os.getenv("TEST_SELECTION_COVERAGE", "0").lower() in ("1", "true", "on")
+TEST_IMPACT_FILE = os.getenv("TEST_IMPACT_FILE", os.path.join("runs", "test_impact.json"))
+
+TEST_IMPACT_VERSION = 2
+SCAN_IGNORE = {'.git', 'runs', '.venv', 'venv', 'node_modules', '__pycache__', '.pytest_cache', '.mypy_cache', 'build', 'dist'}
+# Changes to these can affect any test
+FULL_SUITE_PATTERNS = ('pytest.ini', 'setup.cfg', 'setup.py', 'pyproject.toml', 'tox.ini', 'requirements*.txt', '.coveragerc')
+# Changes to these affect no test
+NO_TEST_PATTERNS = tuple(os.getenv("TEST_SELECTION_IGNORE", "*.md,*.rst,docs/*,bash_scripts/*,LICENSE*,.gitignore").split(','))
+
+
+def is_test_file(path: str) -> bool:
+    name = os.path.basename(path)
+    return name.endswith('.py') and (name.startswith('test_') or name.endswith('_test.py'))
+
+
+def module_names(path: str) -> List[str]:
+    """Every dotted name the file can be imported as: pkg/sub/mod.py gives mod, sub.mod and pkg.sub.mod."""
+    parts = path[:-3].replace(os.sep, '/').split('/')
+    if parts[-1] == '__init__':
+        parts = parts[:-1]
+    return ['.'.join(parts[index:]) for index in range(len(parts))]
+
+
+def parse_imports(source: str, path: str) -> List[List[str]]:
+    """
+    The imports of a file, each as the dotted names to try in order: `from a.b import c` gives
+    [a.b.c, a.b] since c may be a module or a name. Parent packages are not added, so a test only
+    depends on the __init__ files it imports explicitly.
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+    package = path[:-3].replace(os.sep, '/').split('/')[:-1]
+    imports = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.extend([alias.name] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = package[:len(package) - node.level + 1] if node.level > 1 else package
+                module = '.'.join(base + ([node.module] if node.module else []))
+            else:
+                module = node.module or ''
+            for alias in node.names:
+                if alias.name == '*':
+                    imports.append([module])
+                else:
+                    imports.append([f"{module}.{alias.name}".strip('.'), module])
+    return imports
+
+
+class ImpactedTestSelector:
+    """
+    Picks the tests affected by a set of changed files.
+
+    The import graph of the project's Python files is kept in TEST_IMPACT_FILE, keyed by path
+    relative to the project, and re-parsed only for files whose content changed: the size and
+    modification time are checked first, then a content hash, so a materialized copy of the tree
+    reuses the graph of the real one. A test is affected when it reaches a changed
+    file through imports (its conftest.py files included). With TEST_SELECTION_COVERAGE, full runs
+    also record which tests executed each file, which adds dependencies imports do not show. The
+    whole suite runs every TEST_SELECTION_FULL_EVERY runs, when asked to, or when a change can
+    affect any test (test configuration, requirements, files outside the graph).
+    """
+
+    def __init__(self, state_file: str = TEST_IMPACT_FILE, full_every: int = TEST_SELECTION_FULL_EVERY,
+                 collect_coverage: bool = TEST_SELECTION_COVERAGE):
+        self.state_file = state_file
+        self.full_every = full_every
+        self.collect_coverage = collect_coverage
+        self.logger = setup_logger("ImpactedTestSelector")
+        self.state = self._load_state()
+
+    def _load_state(self) -> Dict:
+        empty = {"version": TEST_IMPACT_VERSION, "files": {}, "coverage": {}, "runs_since_full": 0}
+        if not os.path.exists(self.state_file):
+            return empty
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            self.logger.warning(f"Ignoring unreadable test impact file {self.state_file}: {str(e)}")
+            return empty
+        return state if state.get("version") == TEST_IMPACT_VERSION else empty
+
+    def _save_state(self) -> None:
+        os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
+        with open(f"{self.state_file}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(f"{self.state_file}.tmp", self.state_file)
+
+    def update_graph(self, project_dir: Optional[str] = None) -> Dict[str, Dict]:
+        """Scan the project and re-parse the Python files that changed since the last scan."""
+        project_dir = project_dir or os.getcwd()
+        previous, files = self.state["files"], {}
+        parsed = 0
+        for root, dirs, names in os.walk(project_dir):
+            dirs[:] = [d for d in dirs if d not in SCAN_IGNORE and not d.startswith('.')]
+            for name in names:
+                if not name.endswith('.py'):
+                    continue
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, project_dir).replace(os.sep, '/')
+                stat = os.stat(full_path)
+                entry = previous.get(path)
+                if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                    files[path] = entry
+                    continue
+                with open(full_path, 'rb') as f:
+                    content = f.read()
+                digest = hashlib.sha1(content).hexdigest()
+                if entry and entry["hash"] == digest:
+                    files[path] = {**entry, "mtime": stat.st_mtime, "size": stat.st_size}
+                    continue
+                imports = parse_imports(content.decode('utf-8', errors='replace'), path)
+                files[path] = {"mtime": stat.st_mtime, "size": stat.st_size, "hash": digest, "imports": imports}
+                parsed += 1
+        self.state["files"] = files
+        self.logger.info(f"Import graph: {len(files)} Python file(s), {parsed} re-parsed")
+        return files
+
+    def _dependents(self) -> Dict[str, Set[str]]:
+        """For each file, the files that import it directly, and for each conftest.py, the tests under it."""
+        files = self.state["files"]
+        index: Dict[str, List[str]] = {}
+        for path in files:
+            for name in module_names(path):
+                index.setdefault(name, []).append(path)
+        dependents: Dict[str, Set[str]] = {}
+        for path, entry in files.items():
+            for alternatives in entry["imports"]:
+                for name in alternatives:
+                    if name in index:
+                        for target in index[name]:
+                            dependents.setdefault(target, set()).add(path)
+                        break
+            if is_test_file(path):
+                directory = os.path.dirname(path)
+                while True:
+                    conftest = f"{directory}/conftest.py" if directory else "conftest.py"
+                    if conftest in files:
+                        dependents.setdefault(conftest, set()).add(path)
+                    if not directory:
+                        break
+                    directory = os.path.dirname(directory)
+        return dependents
+
+    def select(self, changed_paths: Iterable[str], project_dir: Optional[str] = None) -> Optional[List[str]]:
+        """The test files affected by the changed paths (relative to the project), or None when the whole suite should run."""
+        project_dir = project_dir or os.getcwd()
+        changed = sorted({os.path.relpath(os.path.join(project_dir, path), project_dir).replace(os.sep, '/') for path in changed_paths})
+        self.update_graph(project_dir)
+        files = self.state["files"]
+
+        roots = set()
+        for path in changed:
+            name = os.path.basename(path)
+            if any(fnmatch.fnmatch(name, pattern) for pattern in FULL_SUITE_PATTERNS):
+                self.logger.info(f"{path} can affect every test, running the full suite")
+                return None
+            if any(fnmatch.fnmatch(path, pattern) for pattern in NO_TEST_PATTERNS):
+                continue
+            if not path.endswith('.py'):
+                self.logger.info(f"No test mapping for {path}, running the full suite")
+                return None
+            if path not in files:
+                # Deleted or moved: whatever imported it is affected
+                deleted_names = set(module_names(path))
+                roots.update(other for other, entry in files.items()
+                             if any(name in deleted_names for alternatives in entry["imports"] for name in alternatives))
+            else:
+                roots.add(path)
+
+        dependents = self._dependents()
+        affected, queue = set(roots), deque(roots)
+        while queue:
+            for dependent in dependents.get(queue.popleft(), ()):
+                if dependent not in affected:
+                    affected.add(dependent)
+                    queue.append(dependent)
+        tests = {path for path in affected if is_test_file(path)}
+        for path in changed:
+            tests.update(self.state["coverage"].get(path, []))
+        return sorted(test for test in tests if test in files)
+
+    def run(self, changed_paths: Iterable[str], project_dir: Optional[str] = None, full: bool = False) -> str:
+        """Run the tests affected by the changed paths, or the whole suite when it is due or asked for."""
+        changed_paths = list(changed_paths)
+        selected = None
+        if full:
+            self.logger.info("Full test suite requested")
+        elif self.full_every and self.state["runs_since_full"] + 1 >= self.full_every:
+            self.logger.info(f"Running the full test suite (every {self.full_every} runs)")
+        else:
+            selected = self.select(changed_paths, project_dir)
+
+        if selected is None:
+            output = self._run_full(project_dir)
+            self.state["runs_since_full"] = 0
+        else:
+            self.state["runs_since_full"] += 1
+            if selected:
+                self.logger.info(f"Running {len(selected)} test file(s) affected by {len(changed_paths)} changed file(s)")
+                output = run_unit_tests(project_dir, test_paths=selected)
+            else:
+                output = f"Tests skipped: no tests depend on the {len(changed_paths)} changed file(s)."
+        self._save_state()
+        return output
+
+    def _run_full(self, project_dir: Optional[str]) -> str:
+        project_dir = project_dir or os.getcwd()
+        self.update_graph(project_dir)
+        if not self.collect_coverage:
+            return run_unit_tests(project_dir)
+        if not os.path.exists(os.path.join(os.getcwd(), '.venv', 'bin', 'coverage')):
+            self.logger.warning("TEST_SELECTION_COVERAGE is set but coverage is not installed in .venv, running without it")
+            return run_unit_tests(project_dir)
+        with tempfile.TemporaryDirectory(prefix="my_engineer_coverage_") as coverage_dir:
+            rcfile = os.path.join(coverage_dir, "coveragerc")
+            with open(rcfile, 'w') as f:
+                f.write(f"[run]\ndynamic_context = test_function\ndata_file = {os.path.join(coverage_dir, 'data')}\n")
+            output = run_unit_tests(project_dir, coverage_rcfile=rcfile)
+            report = os.path.join(coverage_dir, "coverage.json")
+            if export_coverage_json(project_dir, rcfile, report):
+                self._load_coverage(report, project_dir)
+        return output
+
+    def _load_coverage(self, report: str, project_dir: str) -> None:
+        with open(report, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        test_modules = {}
+        for path in self.state["files"]:
+            if is_test_file(path):
+                for name in module_names(path):
+                    test_modules.setdefault(name, path)
+        coverage: Dict[str, Set[str]] = {}
+        for file_path, file_data in data.get("files", {}).items():
+            path = os.path.relpath(os.path.join(project_dir, file_path), project_dir).replace(os.sep, '/')
+            for contexts in file_data.get("contexts", {}).values():
+                for context in contexts:
+                    test = self._test_for_context(context, test_modules)
+                    if test and test != path:
+                        coverage.setdefault(path, set()).add(test)
+        self.state["coverage"] = {path: sorted(tests) for path, tests in coverage.items()}
+        self.logger.info(f"Recorded coverage of {len(coverage)} file(s) by the tests")
+
+    @staticmethod
+    def _test_for_context(context: str, test_modules: Dict[str, str]) -> Optional[str]:
+        # Contexts look like tests.test_api.TestClient.test_get|run; the empty one is code run outside tests
+        parts = context.split('|')[0].split('.')
+        for end in range(len(parts), 0, -1):
+            test = test_modules.get('.'.join(parts[:end]))
+            if test:
+                return test
+        return None
+
+
+_selector: Optional[ImpactedTestSelector] = None
+
+
+def get_test_selector() -> ImpactedTestSelector:
+    global _selector
+    if _selector is None:
+        _selector = ImpactedTestSelector()
+    return _selector
+
+
+def run_selected_tests(changed_paths: Iterable[str], project_dir: Optional[str] = None, full: bool = False) -> str:
+    """Run the tests affected by the changed paths with TEST_SELECTION, the whole suite otherwise."""
+    if not TEST_SELECTION:
+        return run_unit_tests(project_dir)
+    return get_test_selector().run(changed_paths, project_dir, full)
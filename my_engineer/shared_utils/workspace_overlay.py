@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from ..shared_utils.logger import setup_logger
+from .workspace_transaction import WorkspaceTransaction, write_file
+
+MATERIALIZE_IGNORE = ('.git', 'runs', '.venv', 'node_modules', '__pycache__', '.pytest_cache')
+
+
+class WorkspaceOverlay:
+    """
+    In-memory layer over the project tree. Writes are kept as new file versions keyed by path
+    and reads see them before the files on disk, so patches, new files and validations can be
+    staged without touching the tree. materialized() gives an isolated copy of the tree with the
+    overlay applied, for running tests, and flush() writes the changes to the real tree.
+    """
+
+    def __init__(self, project_root: str, files: Optional[Dict[str, str]] = None):
+        self.project_root = os.path.abspath(project_root)
+        self.logger = setup_logger("WorkspaceOverlay")
+        self._files: Dict[str, str] = dict(files or {})
+
+    def _key(self, path: str) -> str:
+        return os.path.normpath(os.path.join(self.project_root, path))
+
+    def read(self, path: str) -> str:
+        key = self._key(path)
+        if key in self._files:
+            return self._files[key]
+        with open(key, 'r') as f:
+            return f.read()
+
+    def write(self, path: str, content: str) -> None:
+        self._files[self._key(path)] = content
+
+    def exists(self, path: str) -> bool:
+        key = self._key(path)
+        return key in self._files or os.path.exists(key)
+
+    @property
+    def changes(self) -> Dict[str, str]:
+        """New file versions, keyed by path relative to the project root."""
+        return {os.path.relpath(key, self.project_root): content for key, content in self._files.items()}
+
+    def materialize(self, target_dir: str) -> str:
+        """Copy the project tree to target_dir and apply the overlay there. Returns target_dir."""
+        shutil.copytree(self.project_root, target_dir, symlinks=True, dirs_exist_ok=True,
+                        ignore=shutil.ignore_patterns(*MATERIALIZE_IGNORE))
+        for relative_path, content in self.changes.items():
+            write_file(os.path.join(target_dir, relative_path), content)
+        self.logger.info(f"Materialized the workspace with {len(self._files)} staged file(s) in {target_dir}")
+        return target_dir
+
+    @contextmanager
+    def materialized(self) -> Iterator[str]:
+        target_dir = tempfile.mkdtemp(prefix="my_engineer_overlay_")
+        try:
+            yield self.materialize(target_dir)
+        finally:
+            shutil.rmtree(target_dir, ignore_errors=True)
+
+    def flush(self, transaction: Optional[WorkspaceTransaction] = None) -> int:
+        """Write the staged files to the project tree (through the transaction, if any) and empty the overlay."""
+        count = len(self._files)
+        for key, content in self._files.items():
+            write_file(key, content, transaction)
+        self._files.clear()
+        self.logger.info(f"Flushed {count} staged file(s) to {self.project_root}")
+        return count
+
+    def discard(self) -> None:
+        self._files.clear()
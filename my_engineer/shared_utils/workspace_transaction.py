@@ -0,0 +1,172 @@
+import os
+import json
+import shutil
+import uuid
+from typing import Dict, List, Optional
+from ..shared_utils.logger import setup_logger
+
+JOURNAL_FILE = "journal.json"
+# Set to 0 to skip the fsync at commit (faster, but a crash right after a turn may lose its writes)
+WORKSPACE_FSYNC = os.getenv("WORKSPACE_FSYNC", "1").lower() in ("1", "true", "on")
+
+PENDING = "pending"
+COMMITTING = "committing"
+COMMITTED = "committed"
+ROLLED_BACK = "rolled_back"
+
+
+def _fsync_file(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_dir(path: str) -> None:
+    if os.name == 'nt':  # Directories cannot be opened for fsync on Windows
+        return
+    _fsync_file(path)
+
+
+class WorkspaceTransaction:
+    """
+    Groups every file write of a turn so the turn is applied all at once or not at all.
+
+    write() stages the content in a temporary file next to its target and keeps a copy of the
+    file it replaces in the journal directory. commit() fsyncs the staged files in one batch and
+    moves them into place with os.replace. rollback() discards staged files, or, after a commit,
+    moves the saved copies back and deletes the files the turn created. The journal is on disk,
+    so a committed turn can also be rolled back later with rollback_journal().
+    """
+
+    def __init__(self, journal_dir: str):
+        self.journal_dir = journal_dir
+        self.logger = setup_logger("WorkspaceTransaction")
+        self.status = PENDING
+        self._id = uuid.uuid4().hex[:8]
+        self._entries: Dict[str, Dict] = {}  # target path -> journal entry
+
+    @property
+    def paths(self) -> List[str]:
+        return list(self._entries)
+
+    def read(self, path: str) -> str:
+        """The content of a file as this transaction will leave it."""
+        entry = self._entries.get(os.path.abspath(path))
+        with open(entry["staged"] if entry else path, 'r') as f:
+            return f.read()
+
+    def write(self, path: str, content: str) -> None:
+        if self.status != PENDING:
+            raise RuntimeError(f"Cannot write to a {self.status} transaction")
+        path = os.path.abspath(path)
+        entry = self._entries.get(path)
+        if entry is None:
+            entry = {"path": path, "existed": os.path.exists(path), "backup": None,
+                     "staged": f"{path}.{self._id}.tmp"}
+            if entry["existed"]:
+                os.makedirs(os.path.join(self.journal_dir, "backups"), exist_ok=True)
+                entry["backup"] = os.path.join(self.journal_dir, "backups", str(len(self._entries)))
+                shutil.copy2(path, entry["backup"])
+            self._entries[path] = entry
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(entry["staged"], 'w') as f:
+            f.write(content)
+
+    def commit(self) -> None:
+        if self.status != PENDING:
+            raise RuntimeError(f"Cannot commit a {self.status} transaction")
+        if not self._entries:
+            self.status = COMMITTED
+            return
+        if WORKSPACE_FSYNC:
+            for entry in self._entries.values():
+                _fsync_file(entry["staged"])
+        self._save_journal(COMMITTING)
+        for entry in self._entries.values():
+            if entry["existed"] and os.path.exists(entry["path"]):
+                shutil.copymode(entry["path"], entry["staged"])
+            os.replace(entry["staged"], entry["path"])
+        if WORKSPACE_FSYNC:
+            for directory in {os.path.dirname(entry["path"]) for entry in self._entries.values()}:
+                _fsync_dir(directory)
+        self._save_journal(COMMITTED)
+        self.logger.info(f"Committed {len(self._entries)} file(s), journal in {self.journal_dir}")
+
+    def rollback(self) -> None:
+        if self.status == PENDING:
+            for entry in self._entries.values():
+                if os.path.exists(entry["staged"]):
+                    os.remove(entry["staged"])
+            self.status = ROLLED_BACK
+            self.logger.info(f"Discarded {len(self._entries)} staged file(s)")
+            return
+        rollback_journal(self.journal_dir)
+        self.status = ROLLED_BACK
+
+    def _save_journal(self, status: str) -> None:
+        self.status = status
+        os.makedirs(self.journal_dir, exist_ok=True)
+        journal_path = os.path.join(self.journal_dir, JOURNAL_FILE)
+        with open(f"{journal_path}.tmp", 'w') as f:
+            json.dump({"status": status, "entries": list(self._entries.values())}, f, indent=2)
+        os.replace(f"{journal_path}.tmp", journal_path)
+
+    def __enter__(self) -> "WorkspaceTransaction":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+
+def rollback_journal(journal_dir: str) -> int:
+    """Undo the writes recorded in a transaction journal. Returns the number of files restored or removed."""
+    logger = setup_logger("WorkspaceTransaction")
+    journal_path = os.path.join(journal_dir, JOURNAL_FILE)
+    with open(journal_path, 'r') as f:
+        journal = json.load(f)
+    if journal["status"] == ROLLED_BACK:
+        logger.info(f"Transaction in {journal_dir} was already rolled back")
+        return 0
+
+    for entry in journal["entries"]:
+        if os.path.exists(entry["staged"]):
+            os.remove(entry["staged"])
+        if entry["existed"]:
+            shutil.move(entry["backup"], entry["path"])
+        elif os.path.exists(entry["path"]):
+            os.remove(entry["path"])
+    journal["status"] = ROLLED_BACK
+    with open(f"{journal_path}.tmp", 'w') as f:
+        json.dump(journal, f, indent=2)
+    os.replace(f"{journal_path}.tmp", journal_path)
+    logger.info(f"Rolled back {len(journal['entries'])} file(s) from {journal_dir}")
+    return len(journal["entries"])
+
+
+def write_file(path: str, content: str, workspace=None) -> None:
+    """Write through the workspace (a WorkspaceTransaction or WorkspaceOverlay) when there is one, otherwise atomically in place."""
+    if workspace is not None:
+        workspace.write(path, content)
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(content)
+    if os.path.exists(path):
+        shutil.copymode(path, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def open_turn_transaction(run_dir: str, turn_number: int) -> WorkspaceTransaction:
+    """A transaction whose journal goes to run_dir/transactions/turn_<N> (with a suffix if that turn already has one)."""
+    base = os.path.join(run_dir, "transactions", f"turn_{turn_number}")
+    journal_dir, attempt = base, 1
+    while os.path.exists(journal_dir):
+        attempt += 1
+        journal_dir = f"{base}_{attempt}"
+    return WorkspaceTransaction(journal_dir)
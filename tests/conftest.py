@@ -0,0 +1,4 @@
+import sys
+
+# Importing my_engineer parses the command line of its CLI, which must not see pytest's arguments
+sys.argv = sys.argv[:1]
@@ -0,0 +1,69 @@
+import pytest
+from my_engineer.patch_processor.src.local_patch_engine import LocalPatchEngine
+from my_engineer.patch_processor.src.exceptions import LocalPatchError
+
+ORIGINAL = """def f(a):
+    x = a
+    y = x + 1
+    z = y * 3
+    log(z)
+    w = z * 2
+    return w
+
+
+def g():
+    return 0
+"""
+
+# The hunk leaves out the `log(z)` context line
+OMITTED_CONTEXT_PATCH = """@@ -1,7 +1,7 @@
+ def f(a):
+     x = a
+     y = x + 1
+     z = y * 3
+-    w = z * 2
++    w = z * 4
+     return w
+"""
+
+
+def test_fuzzy_keeps_context_the_hunk_left_out():
+    result = LocalPatchEngine().apply(ORIGINAL, OMITTED_CONTEXT_PATCH)
+
+    assert result.strategy == "fuzzy"
+    assert result.content == ORIGINAL.replace("w = z * 2", "w = z * 4")
+
+
+def test_fuzzy_finds_a_shifted_window():
+    original = "import os\nimport sys\n\n\n" + ORIGINAL
+
+    result = LocalPatchEngine().apply(original, OMITTED_CONTEXT_PATCH)
+
+    assert result.content == original.replace("w = z * 2", "w = z * 4")
+    assert result.content.count("return w") == 1
+
+
+def test_fuzzy_rejects_a_removed_line_missing_from_the_file():
+    patch = OMITTED_CONTEXT_PATCH.replace("-    w = z * 2", "-    w = z * 5")
+
+    with pytest.raises(LocalPatchError):
+        LocalPatchEngine().apply(ORIGINAL, patch)
+
+
+def test_removed_and_added_double_dash_lines_inside_a_hunk():
+    original = "CREATE TABLE t (\n  id int,\n-- drop me\n  name text\n);\n"
+    patch = """--- a/schema.sql
++++ b/schema.sql
+@@ -1,5 +1,5 @@
+ CREATE TABLE t (
+   id int,
+--- drop me
++++ keep me
+   name text
+ );
+"""
+
+    result = LocalPatchEngine().apply(original, patch)
+
+    assert result.strategy == "strict"
+    assert result.content == original.replace("-- drop me", "++ keep me")
@@ -0,0 +1,25 @@
+import time
+import asyncio
+from my_engineer.llm_providers.providers import scheduler as scheduler_module
+from my_engineer.llm_providers.providers.scheduler import get_scheduler
+from my_engineer.llm_providers.providers.stub_provider import StubProvider
+
+
+def test_stub_calls_do_not_wait_for_a_rate_limit_budget(tmp_path, monkeypatch):
+    # Even with the tier-1 budgets enforced, offline calls beyond the requests per minute run at once
+    monkeypatch.setattr(scheduler_module, "LLM_RATE_LIMITS", True)
+    script = tmp_path / "stub.yaml"
+    script.write_text('default: "ok"\n')
+    provider = StubProvider(role="haiku", script_path=str(script))
+    calls = scheduler_module.MODEL_RATE_LIMITS[provider.model]["requests_per_minute"] + 10
+
+    async def run_all():
+        return await asyncio.gather(*(provider.generate_response_async([{"role": "user", "content": f"call {n}"}])
+                                      for n in range(calls)))
+
+    started = time.monotonic()
+    responses = asyncio.run(run_all())
+
+    assert responses == ["ok"] * calls
+    assert time.monotonic() - started < 5
+    assert get_scheduler().stats()[provider.budget_key]["max_wait_seconds"] < 1
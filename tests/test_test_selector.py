@@ -0,0 +1,32 @@
+import os
+import shutil
+from my_engineer.shared_utils.test_runner import test_selector as selector_module
+from my_engineer.shared_utils.test_runner.test_selector import ImpactedTestSelector
+
+
+def test_copy_of_the_tree_reuses_the_import_graph(tmp_path, monkeypatch):
+    project = tmp_path / "project"
+    (project / "pkg").mkdir(parents=True)
+    (project / "tests").mkdir()
+    (project / "pkg" / "__init__.py").write_text("")
+    (project / "pkg" / "core.py").write_text("import os\n")
+    (project / "tests" / "test_core.py").write_text("from pkg import core\n")
+    selector = ImpactedTestSelector(state_file=str(tmp_path / "test_impact.json"))
+    selector.update_graph(str(project))
+
+    parsed = []
+    parse_imports = selector_module.parse_imports
+    monkeypatch.setattr(selector_module, "parse_imports", lambda source, path: parsed.append(path) or parse_imports(source, path))
+    # A snapshot with new modification times and one changed file, as materialized() gives
+    snapshot = tmp_path / "snapshot"
+    shutil.copytree(project, snapshot, copy_function=shutil.copyfile)
+    for root, _, names in os.walk(snapshot):
+        for name in names:
+            os.utime(os.path.join(root, name), (0, 0))
+    (snapshot / "pkg" / "core.py").write_text("import os\nimport json\n")
+
+    files = selector.update_graph(str(snapshot))
+
+    assert parsed == ["pkg/core.py"]
+    assert files["pkg/core.py"]["imports"] == [["os"], ["json"]]
+    assert selector.select(["pkg/core.py"], str(snapshot)) == ["tests/test_core.py"]